@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Precompiled CAN decode plan for the telemetry bridge and the log parser.
+
+Built once from the DBC at startup: every frame ID maps to a decoder, the
+signals that carry FLOAT32_IEEE bit patterns and the interned
+"{frame}/{signal}" output keys, so a received frame costs one dict lookup
+and one unpack. IDs that are not in the DBC go to a negative cache and are
+rejected with a single set lookup afterwards. An optional signal filter
+(see subscription.py) restricts the plan to the signals that are actually
+consumed: frames without any of them are not decoded at all, the others
+only extract the selected signals.
+
+Plain messages (up to 8 bytes, no multiplexing) are compiled into a
+specialized extractor: start bit, length, byte order, signedness,
+scale/offset and the float flags of every signal become straight line
+shifts and masks on the payload read as one 64-bit integer. The same specs
+drive a NumPy mode that decodes a whole uint64 column of payloads at once.
+Anything else falls back to cantools. The results match cantools decode
+(plus the FLOAT32_IEEE reinterpretation) bit for bit, which
+verify_against_cantools() checks over every message of a DBC and over the
+built-in edge_case_database():
+
+    python can_decoder.py --dbc can_messages_mini_celka.dbc
+
+Usage example:
+    import cantools
+    from can_decoder import CanDecodePlan
+
+    plan = CanDecodePlan(cantools.database.load_file("can_messages_mini_celka.dbc"))
+    signals = {}
+    plan.decode_into(msg.id, bytes(msg.data), signals)
+"""
+
+import argparse
+import random
+import struct
+import sys
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from cantools.database import DecodeError
+from cantools.database.conversion import BaseConversion, IdentityConversion, LinearIntegerConversion
+
+FLOAT32_UNIT_TAG = "FLOAT32_IEEE"
+
+_uint32 = struct.Struct("<I")
+_float32 = struct.Struct("<f")
+
+# cantools float signals, raw bit pattern -> float
+_FLOAT_STRUCTS = {
+    16: (struct.Struct("<H"), struct.Struct("<e")),
+    32: (_uint32, _float32),
+    64: (struct.Struct("<Q"), struct.Struct("<d")),
+}
+_NP_FLOAT_TYPES = {32: (np.uint32, np.float32), 64: (np.uint64, np.float64)}
+# NumPy's float16 -> float64 cast does not keep NaN payloads the way struct does, look them up instead
+_FLOAT16_TABLE = np.array(struct.unpack("<65536e", struct.pack("<65536H", *range(65536))), dtype=np.float64)
+
+
+def float32_from_raw(raw: int) -> float:
+    """reinterpret the raw 32 bit pattern of a signal as an IEEE float"""
+    return _float32.unpack(_uint32.pack(raw & 0xFFFFFFFF))[0]
+
+
+# ========== DBC compiler ==========
+
+class CanSignalSpec(NamedTuple):
+    """one signal reduced to what the extractors need"""
+    name: str
+    key: str
+    length: int
+    big_endian: bool
+    shift: int          # shift of the scalar extractor (on the little/big endian payload integer)
+    column_shift: int   # shift in the zero padded 64-bit column of the NumPy mode
+    signed: bool
+    float_bits: int     # 16/32/64 for cantools float signals, 0 for integers
+    scaling: Optional[Tuple[Any, Any]]  # (scale, offset), None when cantools returns the raw value
+    ieee32: bool        # FLOAT32_IEEE unit on an integer valued signal
+
+
+def _signal_spec(signal: Any, msg_length: int, key: str) -> CanSignalSpec:
+    # choices do not matter with decode_choices=False, use the bare scaling
+    conversion = BaseConversion.factory(scale=signal.conversion.scale, offset=signal.conversion.offset, choices=None, is_float=signal.conversion.is_float)
+    if isinstance(conversion, IdentityConversion):
+        scaling = None
+    else:
+        scaling = (conversion.scale, conversion.offset)
+    integer_valued = not signal.is_float and isinstance(conversion, (IdentityConversion, LinearIntegerConversion))
+
+    if signal.byte_order == "little_endian":
+        big_endian = False
+        shift = column_shift = signal.start
+    else:
+        # DBC start bit of a big endian signal is its MSB in sawtooth numbering
+        big_endian = True
+        msb = 8 * (signal.start // 8) + (7 - signal.start % 8)
+        shift = 8 * msg_length - msb - signal.length
+        column_shift = 64 - msb - signal.length
+
+    return CanSignalSpec(
+        name=signal.name,
+        key=key,
+        length=signal.length,
+        big_endian=big_endian,
+        shift=shift,
+        column_shift=column_shift,
+        signed=signal.is_signed and not signal.is_float,
+        float_bits=signal.length if signal.is_float else 0,
+        scaling=scaling,
+        ieee32=integer_valued and FLOAT32_UNIT_TAG in (signal.unit or ""),
+    )
+
+
+def can_compile(can_msg: Any) -> bool:
+    """True if the message fits the 64-bit extractor (classic CAN, no multiplexing, no containers)"""
+    if can_msg.length > 8 or can_msg.is_container or can_msg.is_multiplexed():
+        return False
+    return all(s.length <= 64 and (not s.is_float or s.length in _FLOAT_STRUCTS) for s in can_msg.signals)
+
+
+def _skip_frame(payload: bytes, out: Dict[str, Any]) -> None:
+    """extract() of a frame without subscribed signals"""
+
+
+def _extractor_source(specs: List[CanSignalSpec], length: int) -> str:
+    lines = [
+        "def extract(data, out):",
+        f"    if len(data) != {length}:",
+        f"        if len(data) < {length}:",
+        f"            raise DecodeError('Wrong data size: %d instead of {length} bytes' % len(data))",
+        f"        data = data[:{length}]  # excess bytes are ignored, like cantools does",
+    ]
+    if any(not s.big_endian for s in specs):
+        lines.append("    x = int.from_bytes(data, 'little')")
+    if any(s.big_endian for s in specs):
+        lines.append("    y = int.from_bytes(data, 'big')")
+    for i, s in enumerate(specs):
+        src = "y" if s.big_endian else "x"
+        lines.append(f"    r = ({src} >> {s.shift}) & {(1 << s.length) - 1:#x}" if s.shift else f"    r = {src} & {(1 << s.length) - 1:#x}")
+        if s.signed:
+            lines.append(f"    if r & {1 << (s.length - 1):#x}:")
+            lines.append(f"        r -= {1 << s.length:#x}")
+        value = f"_unpack_f{s.float_bits}(_pack_u{s.float_bits}(r))[0]" if s.float_bits else "r"
+        if s.scaling is not None:
+            value = f"{value} * s{i} + o{i}"
+        if s.ieee32:
+            value = f"_float32_from_raw({value})"
+        lines.append(f"    out[k{i}] = {value}")
+    return "\n".join(lines) + "\n"
+
+
+class CanFrameExtractor(object):
+    """
+    compiled decoder of one CAN message
+
+    decode_into() is generated Python source specialized for the message
+    (kept in source for inspection), decode_columns() applies the same
+    signal specs to a NumPy column of payloads.
+    """
+
+    def __init__(self, can_msg: Any, sep: str = "/", signals: Optional[Set[str]] = None) -> None:
+        self.frame_id: int = can_msg.frame_id
+        self.name: str = can_msg.name
+        self.length: int = can_msg.length
+        self.specs: List[CanSignalSpec] = [
+            _signal_spec(s, can_msg.length, sys.intern(f"{can_msg.name}{sep}{s.name}"))
+            for s in can_msg.signals if signals is None or s.name in signals
+        ]
+        self.keys: Tuple[str, ...] = tuple(s.key for s in self.specs)
+
+        namespace: Dict[str, Any] = {"DecodeError": DecodeError, "_float32_from_raw": float32_from_raw}
+        for bits, (unsigned, floating) in _FLOAT_STRUCTS.items():
+            namespace[f"_pack_u{bits}"] = unsigned.pack
+            namespace[f"_unpack_f{bits}"] = floating.unpack
+        for i, s in enumerate(self.specs):
+            namespace[f"k{i}"] = s.key
+            if s.scaling is not None:
+                namespace[f"s{i}"], namespace[f"o{i}"] = s.scaling
+        self.source = _extractor_source(self.specs, self.length)
+        exec(compile(self.source, f"<can extractor {self.name}>", "exec"), namespace)
+        self.decode_into: Callable[[bytes, Dict[str, Any]], None] = namespace["extract"]
+
+    def decode_columns(self, payloads: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        decode a column of payloads, each read as a little endian uint64
+        (shorter messages zero padded, see payload_column()), returning one
+        array per output key
+        """
+        x = np.asarray(payloads, dtype=np.uint64)
+        y = x.byteswap() if any(s.big_endian for s in self.specs) else None
+        out: Dict[str, np.ndarray] = {}
+        # NaN bit patterns are expected in float signals, do not warn about them
+        with np.errstate(invalid="ignore"):
+            for s in self.specs:
+                out[s.key] = self._decode_column(s, x, y)
+        return out
+
+    @staticmethod
+    def _decode_column(s: CanSignalSpec, x: np.ndarray, y: Optional[np.ndarray]) -> np.ndarray:
+        col = y if s.big_endian else x
+        raw = (col >> np.uint64(s.column_shift)) & np.uint64((1 << s.length) - 1)
+        if s.float_bits == 16:
+            values = _FLOAT16_TABLE[raw.astype(np.intp)]
+        elif s.float_bits:
+            unsigned, floating = _NP_FLOAT_TYPES[s.float_bits]
+            values = raw.astype(unsigned).view(floating).astype(np.float64)
+        elif s.length == 64:
+            values = raw.view(np.int64) if s.signed else raw
+        else:
+            values = raw.astype(np.int64)
+            if s.signed:
+                # two's complement, wrapping is fine here since the result fits
+                values = values - ((values & np.int64(1 << (s.length - 1))) << np.int64(1))
+        if s.scaling is not None:
+            scale, offset = s.scaling
+            if _int_scaling_overflows(s):
+                # cantools keeps integer scaling in Python ints, so does this column
+                values = values.astype(object) * scale + offset
+            else:
+                values = values * scale + offset
+        if s.ieee32:
+            values = (values & 0xFFFFFFFF).astype(np.uint32).view(np.float32).astype(np.float64)
+        return values
+
+
+def _int_scaling_overflows(s: CanSignalSpec) -> bool:
+    """True when an integer scale/offset can leave the int64 range of the raw column"""
+    scale, offset = s.scaling
+    if s.float_bits or not isinstance(scale, int) or not isinstance(offset, int):
+        return False
+    return (1 << s.length) * abs(scale) + abs(offset) >= 1 << 63
+
+
+def payload_column(payloads: Iterable[bytes], length: int = 8) -> np.ndarray:
+    """pack payloads into the uint64 column decode_columns() takes, cut to the message length"""
+    joined = b"".join(p[:length].ljust(8, b"\x00") for p in payloads)
+    return np.frombuffer(joined, dtype="<u8").astype(np.uint64)
+
+
+# ========== Decode plan ==========
+
+class CanFramePlan(object):
+    """
+    everything needed to decode one frame ID, prepared ahead of time,
+    limited to the signal names in signals when given
+    """
+
+    __slots__ = ("frame_id", "name", "decode", "keys", "float_signals", "has_choices", "extractor", "extract")
+
+    def __init__(self, can_msg: Any, sep: str = "/", compiled: bool = True, signals: Optional[Set[str]] = None) -> None:
+        self.frame_id: int = can_msg.frame_id
+        self.name: str = can_msg.name
+        self.decode = can_msg.decode
+        selected = [s for s in can_msg.signals if signals is None or s.name in signals]
+        # signal name -> output key, interned so dict hashing and compares stay cheap downstream
+        self.keys: Dict[str, str] = {s.name: sys.intern(f"{can_msg.name}{sep}{s.name}") for s in selected}
+        self.float_signals: Tuple[str, ...] = tuple(s.name for s in selected if FLOAT32_UNIT_TAG in (s.unit or ""))
+        self.has_choices: bool = any(s.choices for s in selected)
+        self.extractor: Optional[CanFrameExtractor] = None
+        # (payload, out) -> None, the compiled extractor when there is one
+        if not selected:
+            self.extract: Callable[[bytes, Dict[str, Any]], None] = _skip_frame
+        elif compiled and can_compile(can_msg):
+            self.extractor = CanFrameExtractor(can_msg, sep, signals)
+            self.extract = self.extractor.decode_into
+        else:
+            self.extract = self.decode_cantools
+
+    @property
+    def skipped(self) -> bool:
+        """True when no signal of the frame is subscribed"""
+        return not self.keys
+
+    def decode_into(self, payload: bytes, out: Dict[str, Any]) -> None:
+        """decode one payload into out under the frame keys, raises like cantools on malformed data"""
+        self.extract(payload, out)
+
+    def decode_cantools(self, payload: bytes, out: Dict[str, Any], decode_choices: bool = False) -> None:
+        """
+        decode_into() through cantools, for messages the extractor does not
+        cover or when value table names are wanted (decode_choices=True)
+        """
+        decoded = self.decode(payload, decode_choices=decode_choices)
+        for name in self.float_signals:
+            raw = decoded.get(name)
+            if isinstance(raw, int):
+                decoded[name] = float32_from_raw(raw)
+        keys = self.keys
+        for name, value in decoded.items():
+            key = keys.get(name)
+            if key is not None:  # not subscribed
+                out[key] = value
+
+
+class CanDecodePlan(object):
+    """
+    frame ID -> CanFramePlan for a whole DBC, with a negative cache for
+    unknown IDs
+
+    signal_filter is called once per signal with its "{frame}/{signal}"
+    name (always "/" separated, whatever sep is) and decides whether the
+    signal is decoded, None decodes everything.
+    """
+
+    def __init__(self, dbc: Any, sep: str = "/", compiled: bool = True,
+                 signal_filter: Optional[Callable[[str], bool]] = None) -> None:
+        self.dbc = dbc
+        self.sep = sep
+        self.compiled = compiled
+        self.signal_filter = signal_filter
+        self.frames: Dict[int, CanFramePlan] = {m.frame_id: self._frame_plan(m) for m in dbc.messages}
+        self.unknown_ids: Set[int] = set()
+
+    def _frame_plan(self, can_msg: Any) -> CanFramePlan:
+        signals = None
+        if self.signal_filter is not None:
+            signals = {s.name for s in can_msg.signals if self.signal_filter(f"{can_msg.name}/{s.name}")}
+        return CanFramePlan(can_msg, self.sep, self.compiled, signals)
+
+    def signal_count(self) -> Tuple[int, int]:
+        """(selected, total) signals over the frames of the DBC"""
+        plans = [self.frames[m.frame_id] for m in self.dbc.messages]
+        return sum(len(p.keys) for p in plans), sum(len(m.signals) for m in self.dbc.messages)
+
+    def skipped_frames(self) -> List[str]:
+        """names of the DBC frames that are not decoded at all"""
+        return [m.name for m in self.dbc.messages if self.frames[m.frame_id].skipped]
+
+    def lookup(self, frame_id: int) -> Optional[CanFramePlan]:
+        """plan for frame_id, None (cached) when the DBC does not know it"""
+        plan = self.frames.get(frame_id)
+        if plan is not None or frame_id in self.unknown_ids:
+            return plan
+        # cantools also matches IDs after masking (e.g. extended frame flags)
+        try:
+            plan = self._frame_plan(self.dbc.get_message_by_frame_id(frame_id))
+        except KeyError:
+            self.unknown_ids.add(frame_id)
+            return None
+        self.frames[frame_id] = plan
+        return plan
+
+    def decode_into(self, frame_id: int, payload: bytes, out: Dict[str, Any]) -> Optional[CanFramePlan]:
+        """
+        decode one frame straight into out, returning its plan or None for
+        an unknown frame ID (decode errors raise)
+        """
+        plan = self.frames.get(frame_id)
+        if plan is None:
+            plan = self.lookup(frame_id)
+            if plan is None:
+                return None
+        plan.extract(payload, out)
+        return plan
+
+
+# ========== Differential check ==========
+
+def _same_value(a: Any, b: Any) -> bool:
+    """bit for bit equality, NaN payloads and signed zeros included"""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, float):
+        return struct.pack("<d", a) == struct.pack("<d", b)
+    return a == b
+
+
+def verify_against_cantools(dbc: Any, samples: int = 1000, seed: int = 0) -> Dict[str, Any]:
+    """
+    decode random and edge case payloads of every compilable message in the
+    DBC with cantools and with both extractor modes, returning a summary
+    with a list of mismatches (empty when everything matches)
+    """
+    rng = random.Random(seed)
+    summary: Dict[str, Any] = {"messages": len(dbc.messages), "compiled": 0, "skipped": [], "frames": 0, "mismatches": []}
+    for can_msg in dbc.messages:
+        if not can_compile(can_msg):
+            summary["skipped"].append(can_msg.name)
+            continue
+        summary["compiled"] += 1
+        reference = CanFramePlan(can_msg, compiled=False)
+        extractor = CanFrameExtractor(can_msg)
+
+        n = can_msg.length
+        payloads = [bytes(n), b"\xff" * n, b"\x80" * n, b"\x7f" * n]
+        payloads += [bytes(rng.getrandbits(8) for _ in range(n)) for _ in range(samples)]
+        payloads.append(bytes(rng.getrandbits(8) for _ in range(8)))  # excess bytes, cut by both
+        columns = {k: v.tolist() for k, v in extractor.decode_columns(payload_column(payloads, n)).items()}
+
+        for row, payload in enumerate(payloads):
+            expected: Dict[str, Any] = {}
+            scalar: Dict[str, Any] = {}
+            reference.decode_into(payload, expected)
+            extractor.decode_into(payload, scalar)
+            summary["frames"] += 1
+            for key, value in expected.items():
+                for mode, got in (("scalar", scalar.get(key)), ("numpy", columns[key][row])):
+                    if not _same_value(value, got):
+                        summary["mismatches"].append(f"{key} [{mode}] payload {payload.hex()}: cantools {value!r}, compiled {got!r}")
+    return summary
+
+
+def edge_case_database() -> Any:
+    """
+    messages the extractors get wrong most easily, checked on every run of
+    the CLI: integer scaling past int64 (64-bit signals, large scales) and
+    float16 NaN payloads, which a DBC file cannot even describe
+    """
+    from cantools.database.can import Database, Message, Signal
+
+    def conv(scale: Any, offset: Any, is_float: bool = False) -> BaseConversion:
+        return BaseConversion.factory(scale=scale, offset=offset, is_float=is_float)
+
+    db = Database([
+        Message(0x7F0, "EDGE_U64_SCALED", 8, [Signal("u64", 0, 64, conversion=conv(3, 5))]),
+        Message(0x7F1, "EDGE_S64_SCALED", 8, [Signal("s64", 0, 64, is_signed=True, conversion=conv(2, -1))]),
+        Message(0x7F2, "EDGE_FLOAT16", 8, [
+            Signal("h", 0, 16, conversion=conv(1, 0, True)),
+            Signal("h_scaled", 23, 16, byte_order="big_endian", conversion=conv(2, 1, True)),
+            Signal("big_scale", 32, 32, is_signed=True, conversion=conv(10 ** 12, 0)),
+        ]),
+    ])
+    db.refresh()
+    return db
+
+
+def _report(label: str, summary: Dict[str, Any]) -> bool:
+    print(f"[verify] {label}: {summary['compiled']}/{summary['messages']} messages compiled, {summary['frames']} frames compared")
+    if summary["skipped"]:
+        print(f"[verify] Left to cantools: {', '.join(summary['skipped'])}")
+    for line in summary["mismatches"][:20]:
+        print(f"[mismatch] {line}")
+    if summary["mismatches"]:
+        print(f"[verify] {len(summary['mismatches'])} mismatches")
+    return not summary["mismatches"]
+
+
+# ========== CLI entrypoint ==========
+if __name__ == "__main__":
+    import cantools
+
+    parser = argparse.ArgumentParser(description="Check the compiled CAN extractors against cantools for a whole DBC")
+    parser.add_argument("--dbc", help="Path to .dbc file, without it only the built-in edge cases are checked")
+    parser.add_argument("--samples", type=int, default=1000, help="Random payloads per message")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    ok = _report("edge cases", verify_against_cantools(edge_case_database(), args.samples, args.seed))
+    if args.dbc:
+        ok = _report(args.dbc, verify_against_cantools(cantools.database.load_file(args.dbc), args.samples, args.seed)) and ok
+    if not ok:
+        sys.exit(1)
+    print("[verify] Compiled extractors match cantools bit for bit")
@@ -0,0 +1,399 @@
+"""
+Raw UART capture files for the telemetry bridge.
+
+Every chunk returned by ser.read is appended unchanged together with the
+host monotonic time it was read at, so a field session can be decoded
+again later, replayed into the bridge or used as parser benchmark data.
+
+File layout (little endian):
+    header   magic b"MMCCAP01", u16 version, u16 reserved, u32 baudrate,
+             i64 wall clock ns at open, i64 monotonic ns at open      (32 bytes)
+    records  i64 monotonic ns, u32 length, length bytes of raw UART data
+    index    n x (i64 monotonic ns, u64 file offset of the record)
+    trailer  magic b"MMCCIDX1", u64 index offset, u64 index entries,
+             u64 records                                              (32 bytes)
+
+The index has one entry every INDEX_INTERVAL bytes of records and is only
+written when a file is closed. A file without a trailer (bridge killed,
+power lost) is still readable, CaptureReader then scans the records and
+ignores a truncated last one.
+
+CaptureWriter never blocks the serial reader: chunks go through a ChunkRing
+to a background thread that writes through a large buffer and rotates to a
+new file after max_bytes. The ring holds minutes of UART traffic so a disk
+stall does not lose data; should it still overflow, the dropped chunks are
+counted and reported when the capture is closed.
+
+ReplaySerial plays capture files back through the serial.Serial calls the
+bridge uses, in real time, N times faster or as fast as possible.
+
+Usage example:
+    python capture.py captures/session_20250101_120000_000.mmcap
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pipeline import ChunkRing
+
+CAPTURE_MAGIC = b"MMCCAP01"
+INDEX_MAGIC = b"MMCCIDX1"
+CAPTURE_VERSION = 1
+CAPTURE_SUFFIX = ".mmcap"
+INDEX_INTERVAL = 64 * 1024
+
+_header = struct.Struct("<8sHHIqq")
+_record = struct.Struct("<qI")
+_index_entry = struct.Struct("<qQ")
+_trailer = struct.Struct("<8sQQQ")
+# the rotation counter CaptureWriter appends to the session name
+_rotation_suffix = re.compile(r"_\d{3}$")
+
+
+class CaptureError(Exception):
+    """not a capture file or a damaged header"""
+
+
+class CaptureWriter(object):
+    """
+    background writer of capture files, write() only queues the chunk
+
+    Files are named {prefix}_{YYYYmmdd_HHMMSS}_{n:03d}.mmcap inside directory,
+    max_bytes=0 keeps everything in the first one. Existing files are never
+    overwritten, a run starting in the same second as another one gets a
+    _2, _3... session suffix.
+    """
+
+    def __init__(self, directory: str, prefix: str = "capture", baudrate: int = 0,
+                 max_bytes: int = 256 * 1024 * 1024, queue_len: int = 65536,
+                 buffer_size: int = 1024 * 1024) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.baudrate = baudrate
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.ring = ChunkRing(queue_len)
+        self.session = time.strftime("%Y%m%d_%H%M%S")
+        self.files: List[str] = []
+        self.bytes_written = 0
+        self.records = 0
+        self.write_errors = 0
+
+        self._file = None
+        self.start_ns = 0  # monotonic ns in the header of the current file
+        self._size = 0
+        self._file_records = 0
+        self._index: List[Tuple[int, int]] = []
+        self._next_index = 0
+        self._open_next()
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, t_ns: int, chunk: bytes, block: bool = False) -> None:
+        """queue one chunk read at monotonic time t_ns (time.monotonic_ns()), block=True never drops"""
+        self.ring.push(t_ns, chunk, block)
+
+    def close(self) -> None:
+        """flush everything queued, write the index and close the file"""
+        self.ring.close()
+        self._thread.join()
+        if self.ring.dropped:
+            print(f"[warn] capture lost {self.ring.dropped} chunks ({self.ring.dropped_bytes} bytes), "
+                  f"the writer could not keep up")
+
+    @property
+    def current_file(self) -> Optional[str]:
+        return self.files[-1] if self.files else None
+
+    def signals(self, prefix: str = "bridge/capture/") -> dict:
+        return {
+            prefix + "bytes": self.bytes_written,
+            prefix + "records": self.records,
+            prefix + "files": len(self.files),
+            prefix + "drops": self.ring.dropped,
+            prefix + "write_errors": self.write_errors,
+        }
+
+    # --- writer thread ---
+
+    def _run(self) -> None:
+        ring = self.ring
+        while True:
+            chunks = ring.pop_all(timeout=0.5)
+            for t_ns, chunk in chunks:
+                try:
+                    self._append(t_ns, chunk)
+                except OSError as e:
+                    self.write_errors += 1
+                    print(f"[warn] capture write failed: {e}")
+            if ring.closed and not chunks:
+                break
+        self._finish()
+
+    def _open_next(self) -> None:
+        base = self.session
+        attempt = 1
+        while True:
+            name = f"{self.prefix}_{self.session}_{len(self.files):03d}{CAPTURE_SUFFIX}"
+            path = os.path.join(self.directory, name)
+            try:
+                self._file = open(path, "xb", buffering=self.buffer_size)
+                break
+            except FileExistsError:
+                if self.files:
+                    raise  # a rotated file of this session, never rename a running session
+                attempt += 1
+                self.session = f"{base}_{attempt}"
+        self.start_ns = time.monotonic_ns()
+        self._file.write(_header.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0, self.baudrate,
+                                      time.time_ns(), self.start_ns))
+        self._size = _header.size
+        self._file_records = 0
+        self._index = []
+        self._next_index = self._size
+        self.files.append(path)
+
+    def _append(self, t_ns: int, chunk: bytes) -> None:
+        n = _record.size + len(chunk)
+        if self.max_bytes and self._file_records and self._size + n > self.max_bytes:
+            self._finish()
+            self._open_next()
+        if self._size >= self._next_index:
+            self._index.append((t_ns, self._size))
+            self._next_index = self._size + INDEX_INTERVAL
+        self._file.write(_record.pack(t_ns, len(chunk)))
+        self._file.write(chunk)
+        self._size += n
+        self._file_records += 1
+        self.records += 1
+        self.bytes_written += len(chunk)
+
+    def _finish(self) -> None:
+        if self._file is None:
+            return
+        f = self._file
+        index_offset = self._size
+        f.write(b"".join(_index_entry.pack(t, off) for t, off in self._index))
+        f.write(_trailer.pack(INDEX_MAGIC, index_offset, len(self._index), self._file_records))
+        f.close()
+        self._file = None
+
+
+class CaptureReader(object):
+    """memory mapped read access to one capture file"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _header.size:
+                raise CaptureError(f"{path}: too short for a capture file")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, _, self.baudrate, self.wall_ns, self.start_ns = _header.unpack_from(self._map, 0)
+        if magic != CAPTURE_MAGIC:
+            raise CaptureError(f"{path}: not a capture file")
+        if self.version != CAPTURE_VERSION:
+            raise CaptureError(f"{path}: unsupported capture version {self.version}")
+
+        self.complete = False
+        self.end = size
+        self.index: List[Tuple[int, int]] = []
+        if size >= _header.size + _trailer.size:
+            magic, index_offset, entries, records = _trailer.unpack_from(self._map, size - _trailer.size)
+            if magic == INDEX_MAGIC and index_offset + entries * _index_entry.size + _trailer.size == size:
+                self.complete = True
+                self.end = index_offset
+                self.records = records
+                self.index = [_index_entry.unpack_from(self._map, index_offset + i * _index_entry.size)
+                              for i in range(entries)]
+        if not self.complete:
+            # no footer, walk the records once and rebuild the index
+            self.records = 0
+            next_index = _header.size
+            for t_ns, offset, _ in self._scan(_header.size):
+                if offset >= next_index:
+                    self.index.append((t_ns, offset))
+                    next_index = offset + INDEX_INTERVAL
+                self.records += 1
+        self._index_times = [t for t, _ in self.index]
+
+    @property
+    def session(self) -> str:
+        """file name without the rotation counter, the same for all files of one bridge run"""
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        return _rotation_suffix.sub("", stem)
+
+    def _scan(self, offset: int) -> Iterator[Tuple[int, int, int]]:
+        """(t_ns, record offset, record length) from offset on, stops at a truncated record"""
+        buf = self._map
+        end = self.end
+        while offset + _record.size <= end:
+            t_ns, n = _record.unpack_from(buf, offset)
+            if offset + _record.size + n > end:
+                break
+            yield t_ns, offset, n
+            offset += _record.size + n
+        if not self.complete:
+            self.end = offset
+
+    def __iter__(self) -> Iterator[Tuple[int, bytes]]:
+        return self.chunks()
+
+    def __len__(self) -> int:
+        return self.records
+
+    def chunks(self, from_ns: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+        """(t_ns, chunk) in file order, starting at the first record at or after from_ns"""
+        offset = _header.size if from_ns is None else self.seek(from_ns)
+        buf = self._map
+        for t_ns, offset, n in self._scan(offset):
+            if from_ns is not None and t_ns < from_ns:
+                continue
+            start = offset + _record.size
+            yield t_ns, buf[start:start + n]
+
+    def seek(self, t_ns: int) -> int:
+        """file offset of an indexed record at or before t_ns"""
+        i = bisect.bisect_right(self._index_times, t_ns) - 1
+        return self.index[i][1] if i >= 0 else _header.size
+
+    def time_range(self) -> Tuple[int, int]:
+        """monotonic ns of the first and the last record"""
+        first = last = self.start_ns
+        for t_ns, _, _ in self._scan(self.index[-1][1] if self.index else _header.size):
+            last = t_ns
+        if self.index:
+            first = self.index[0][0]
+        return first, last
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ReplaySerial(object):
+    """
+    stands in for serial.Serial, read() returns the recorded chunks of one or
+    more capture files in order
+
+    speed 1.0 keeps the recorded timing, 10.0 plays ten times faster and 0
+    returns every chunk as soon as it is asked for. Writes are counted and
+    discarded. finished turns True after the last chunk has been returned.
+
+    The rotated files of one session share a clock, every other session
+    (another bridge run, its monotonic base is unrelated) starts right
+    after the previous one instead of after the recorded gap.
+    """
+
+    def __init__(self, paths: Iterable[str], speed: float = 1.0, baudrate: Optional[int] = None,
+                 timeout: float = 0.01) -> None:
+        self.paths = list(paths)
+        if not self.paths:
+            raise CaptureError("no capture files to replay")
+        self.speed = speed
+        self.timeout = timeout
+        self.finished = False
+        self.chunks = 0
+        self.bytes = 0
+        self.written = 0
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+
+        self._readers = [CaptureReader(path) for path in self.paths]
+        self.baudrate = baudrate or self._readers[0].baudrate or 115200
+        self._records = self._iter_records()
+        self._next = next(self._records, None)
+        self._session: Optional[str] = None
+        self._t0_ns = 0
+        self._t0 = 0.0  # time.perf_counter() of _t0_ns
+
+    def _iter_records(self) -> Iterator[Tuple[str, int, bytes]]:
+        for reader in self._readers:
+            session = reader.session
+            for t_ns, chunk in reader:
+                yield session, t_ns, chunk
+
+    @property
+    def in_waiting(self) -> int:
+        if self._next is None or not self._due():
+            return 0
+        return len(self._next[2])
+
+    def _due(self) -> bool:
+        return self.speed <= 0 or self._next[0] != self._session or self._delay() <= 0
+
+    def _delay(self) -> float:
+        """seconds until the next chunk is due"""
+        return (self._next[1] - self._t0_ns) / 1e9 / self.speed - (time.perf_counter() - self._t0)
+
+    def read(self, size: int = 1) -> bytes:
+        """the next recorded chunk once it is due, b"" after timeout or at the end"""
+        if self._next is None:
+            if not self.finished:
+                self.finished = True
+                self.stopped = time.perf_counter()
+            time.sleep(self.timeout)
+            return b""
+        if self._next[0] != self._session:
+            # first chunk of a session, its timing starts now
+            self._session, self._t0_ns = self._next[0], self._next[1]
+            self._t0 = time.perf_counter()
+            if self.started is None:
+                self.started = self._t0
+        if self.speed > 0:
+            delay = self._delay()
+            if delay > self.timeout:
+                time.sleep(self.timeout)
+                return b""
+            if delay > 0:
+                time.sleep(delay)
+        # recorded chunks are returned whole, the bridge always asks for in_waiting anyway
+        chunk = bytes(self._next[2])
+        self._next = next(self._records, None)
+        self.chunks += 1
+        self.bytes += len(chunk)
+        return chunk
+
+    def write(self, data: bytes) -> int:
+        self.written += len(data)
+        return len(data)
+
+    def elapsed(self, until: Optional[float] = None) -> float:
+        """seconds from the first chunk to until (time.perf_counter()), the last chunk or now"""
+        if self.started is None:
+            return 0.0
+        return (until or self.stopped or time.perf_counter()) - self.started
+
+    def close(self) -> None:
+        for reader in self._readers:
+            reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize raw UART capture files")
+    parser.add_argument("files", nargs="+", help="Capture files (.mmcap)")
+    args = parser.parse_args()
+
+    for path in args.files:
+        with CaptureReader(path) as cap:
+            first, last = cap.time_range()
+            duration = (last - first) / 1e9
+            payload = cap.end - _header.size - cap.records * _record.size
+            opened = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cap.wall_ns / 1e9))
+            print(f"{path}: opened {opened}, {cap.records} chunks, {payload} bytes, {duration:.1f} s"
+                  f"{'' if cap.complete else ', no index footer (not closed cleanly)'}")
+            if duration > 0:
+                print(f"  average {payload / duration:.0f} B/s, {len(cap.index)} index entries")
@@ -0,0 +1,257 @@
+"""
+MCU to host clock alignment from the GENERIC_CAN_FRAME timestamp field.
+
+Every CAN frame carries the MCU tick (uint32) it was captured at, the host
+only knows when the chunk holding it arrived. The arrival time is the send
+time plus a delay that is never below the link minimum but often far above
+it (radio buffering, retries, serial chunking). ClockSync therefore tracks
+the lower envelope of (host time - MCU time):
+
+  - ticks are unwrapped across uint32 overflow, a large backward jump is
+    treated as an MCU reset and restarts the estimate
+  - per window_s of MCU time only the smallest difference is kept, which
+    belongs to the least delayed frame of that window
+  - a line through the last windows gives offset and drift, windows far
+    above the line (a window where every frame was delayed) are rejected
+
+to_host() then maps any tick to the host time it was captured at, never
+later than the time it was received.
+
+Offline, align_offline() runs the same estimator frame by frame over a
+recording, so a capture decoded later (logs_parser.py --input capture.mmcap)
+gets exactly the timebase the live plots had. `python clock_sync.py
+capture.mmcap` reports the fit of a raw UART capture, `--check` runs the
+tick unwrap checks.
+"""
+
+import argparse
+import collections
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+TICK_WRAP = 1 << 32
+
+
+class ClockSync(object):
+    """online MCU tick -> host time estimator, host times in seconds on any monotonic clock"""
+
+    def __init__(self, tick_hz: float = 1000.0, window_s: float = 1.0, windows: Optional[int] = 30,
+                 outlier_s: float = 0.05, reset_s: float = 2.0) -> None:
+        self.tick_s = 1.0 / tick_hz
+        self.window_s = window_s
+        self.outlier_s = outlier_s
+        self.reset_ticks = int(reset_s * tick_hz)
+        self.points: Deque[Tuple[float, float]] = collections.deque(maxlen=windows)
+        self.resets = 0
+        self.outliers = 0
+        self.samples = 0
+        self._restart()
+
+    def _restart(self) -> None:
+        self.points.clear()
+        self.intercept: Optional[float] = None  # (host - mcu) at mcu time 0
+        self.drift = 0.0                         # d(host - mcu)/d(mcu)
+        self.last_delay = 0.0
+        self._last_raw: Optional[int] = None
+        self._wraps = 0
+        self._window_end: Optional[float] = None
+        self._window_min: Optional[Tuple[float, float]] = None
+        self._rejected_in_row = 0
+
+    # --- tick handling ---
+
+    def unwrap(self, raw: int) -> Optional[float]:
+        """MCU time in seconds since the first tick, None after an MCU reset"""
+        last = self._last_raw
+        if last is not None and raw < last:
+            if last - raw > TICK_WRAP // 2:
+                self._wraps += 1
+            elif last - raw > self.reset_ticks:
+                return None
+            else:
+                # slightly older frame from another CAN queue, keep the high water mark
+                return ((self._wraps << 32) + raw) * self.tick_s
+        elif last is not None and raw - last > TICK_WRAP // 2:
+            # older frame from before the last wrap, arriving after the first one past it
+            return (((self._wraps - 1) << 32) + raw) * self.tick_s
+        self._last_raw = raw
+        return ((self._wraps << 32) + raw) * self.tick_s
+
+    # --- estimate ---
+
+    def update(self, raw: int, host: float) -> float:
+        """feed the tick of a frame received at host, returns its reconstructed host time"""
+        t = self.unwrap(raw)
+        if t is None:
+            self.resets += 1
+            self._restart()
+            t = self.unwrap(raw)
+        self.samples += 1
+        d = host - t
+
+        if self._window_end is None:
+            self._window_end = t + self.window_s
+        elif t >= self._window_end:
+            self._close_window()
+            self._window_end = t + self.window_s
+        if self._window_min is None or d < self._window_min[1]:
+            self._window_min = (t, d)
+
+        est = self._estimate(t)
+        if est is None or d < est:
+            est = d
+        self.last_delay = d - est
+        return t + est
+
+    def _estimate(self, t: float) -> Optional[float]:
+        if self.intercept is None:
+            return self._window_min[1] if self._window_min is not None else None
+        return self.intercept + self.drift * t
+
+    def _close_window(self) -> None:
+        t, d = self._window_min
+        self._window_min = None
+        if self.intercept is not None and d - (self.intercept + self.drift * t) > self.outlier_s:
+            self.outliers += 1
+            self._rejected_in_row += 1
+            if self._rejected_in_row < 3:
+                return
+            # the offset really moved, follow it instead of rejecting forever
+            self.points.clear()
+        self._rejected_in_row = 0
+        self.points.append((t, d))
+        self._fit()
+
+    def _fit(self) -> None:
+        self.intercept, self.drift = _line(self.points)
+
+    def to_host(self, raw: int, received: Optional[float] = None) -> Optional[float]:
+        """host time of a tick with the current estimate, without feeding it"""
+        if self._last_raw is None:
+            return None
+        t = ((self._wraps << 32) + raw) * self.tick_s
+        if raw > self._last_raw + TICK_WRAP // 2 and self._wraps:
+            t -= TICK_WRAP * self.tick_s  # tick from before the last wrap
+        est = self._estimate(t)
+        if est is None:
+            return None
+        host = t + est
+        return host if received is None else min(host, received)
+
+    @property
+    def offset(self) -> Optional[float]:
+        """host - mcu seconds at the newest tick"""
+        if self._last_raw is None:
+            return None
+        return self._estimate(((self._wraps << 32) + self._last_raw) * self.tick_s)
+
+    def signals(self, prefix: str = "bridge/clock/") -> Dict[str, Any]:
+        offset = self.offset
+        return {
+            prefix + "offset_ms": offset * 1000.0 if offset is not None else float("nan"),
+            prefix + "drift_ppm": self.drift * 1e6,
+            prefix + "delay_ms": self.last_delay * 1000.0,
+            prefix + "windows": len(self.points),
+            prefix + "outliers": self.outliers,
+            prefix + "resets": self.resets,
+        }
+
+
+def _line(points: Sequence[Tuple[float, float]]) -> Tuple[float, float]:
+    """least squares d = a + b t, b = 0 for a single point"""
+    n = len(points)
+    if n == 1:
+        return points[0][1], 0.0
+    mt = sum(t for t, _ in points) / n
+    md = sum(d for _, d in points) / n
+    stt = sum((t - mt) ** 2 for t, _ in points)
+    if stt <= 0:
+        return md, 0.0
+    b = sum((t - mt) * (d - md) for t, d in points) / stt
+    return md - b * mt, b
+
+
+def align_offline(ticks: Sequence[int], hosts: Sequence[float], tick_hz: float = 1000.0,
+                  window_s: float = 1.0, windows: Optional[int] = 30,
+                  outlier_s: float = 0.05) -> Tuple[List[float], List[Dict[str, float]]]:
+    """
+    reconstructed host times for a whole recording through ClockSync, the
+    same causal estimate the bridge computes live, plus {"start", "offset",
+    "drift", "outliers"} at the end of every MCU uptime (split at resets)
+    """
+    # split where ClockSync itself would restart, one estimator per uptime
+    splitter = ClockSync(tick_hz)
+    segments: List[List[Tuple[int, float]]] = [[]]
+    for raw, host in zip(ticks, hosts):
+        if splitter.unwrap(raw) is None:
+            splitter._restart()
+            splitter.unwrap(raw)
+            segments.append([])
+        segments[-1].append((raw, host))
+
+    out: List[float] = []
+    fits: List[Dict[str, float]] = []
+    for segment in segments:
+        if not segment:
+            continue
+        sync = ClockSync(tick_hz, window_s, windows, outlier_s)
+        out.extend(sync.update(raw, host) for raw, host in segment)
+        fits.append({"start": segment[0][1], "offset": sync.offset, "drift": sync.drift, "outliers": sync.outliers})
+    return out, fits
+
+
+def check_unwrap() -> None:
+    """frames reordered around a uint32 wrap count it once"""
+    sync = ClockSync(1000.0)
+    times = [sync.unwrap(raw) for raw in (0xFFFFFFF0, 0x10, 0xFFFFFFF8, 0x20)]
+    assert sync._wraps == 1, sync._wraps
+    span = TICK_WRAP * sync.tick_s
+    assert times == [0xFFFFFFF0 * sync.tick_s, span + 0x10 * sync.tick_s,
+                     0xFFFFFFF8 * sync.tick_s, span + 0x20 * sync.tick_s], times
+
+
+def capture_ticks(path: str) -> Tuple[List[int], List[float], List[Any]]:
+    """MCU ticks, host receive times (wall clock seconds) and GENERIC_CAN_FRAME messages of a capture"""
+    import mavmc_dialect as mavlink
+    from capture import CaptureReader
+
+    parser = mavlink.MAVLink(None)
+    parser.fast_resync = True
+    parser.set_subscription({mavlink.MAVLINK_MSG_ID_GENERIC_CAN_FRAME})
+    ticks, hosts, msgs = [], [], []
+    with CaptureReader(path) as cap:
+        to_wall = (cap.wall_ns - cap.start_ns) / 1e9
+        for t_ns, chunk in cap:
+            for msg in parser.parse_chunk(chunk):
+                if msg.get_msgId() == mavlink.MAVLINK_MSG_ID_GENERIC_CAN_FRAME:
+                    ticks.append(msg.timestamp)
+                    hosts.append(t_ns / 1e9 + to_wall)
+                    msgs.append(msg)
+    return ticks, hosts, msgs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the MCU clock of a raw UART capture to host time")
+    parser.add_argument("capture", nargs="?", help="Capture file (.mmcap)")
+    parser.add_argument("--check", action="store_true", help="Run the tick unwrap checks and exit")
+    parser.add_argument("--tick-hz", type=float, default=1000.0, help="MCU timestamp ticks per second")
+    parser.add_argument("--window", type=float, default=1.0, help="Lower envelope window in seconds")
+    parser.add_argument("--outlier", type=float, default=0.05, help="Window rejection threshold in seconds")
+    args = parser.parse_args()
+    if args.check:
+        check_unwrap()
+        print("[clock] unwrap checks passed")
+        raise SystemExit(0)
+    if not args.capture:
+        parser.error("a capture file is required")
+
+    ticks, hosts, msgs = capture_ticks(args.capture)
+    if not ticks:
+        raise SystemExit(f"{args.capture}: no GENERIC_CAN_FRAME messages")
+    aligned, fits = align_offline(ticks, hosts, args.tick_hz, args.window, outlier_s=args.outlier)
+    for i, fit in enumerate(fits):
+        print(f"[clock] segment {i}: drift {fit['drift'] * 1e6:+.1f} ppm, {fit['outliers']} windows rejected")
+    delays = sorted(h - a for h, a in zip(hosts, aligned))
+    n = len(delays)
+    print(f"[clock] {n} frames, receive delay above the envelope: p50 {delays[n // 2] * 1000:.1f} "
+          f"p95 {delays[int(n * 0.95)] * 1000:.1f} p99 {delays[int(n * 0.99)] * 1000:.1f} "
+          f"max {delays[-1] * 1000:.1f} ms")
@@ -0,0 +1,190 @@
+"""
+Compact UDP encoding for the telemetry bridge.
+
+Signal names are interned once: a schema packet lists every name, its
+position is the integer id used by the data packets that follow. Data
+packets only carry the ids and values that changed since the previous
+packet, so slowly changing diagnostics cost nothing until they move.
+
+The schema (together with a full keyframe of every value) is re-sent every
+schema_period seconds and immediately when new names show up, so a
+consumer that starts late or misses a packet catches up on its own.
+
+Both kinds are split to stay under max_datagram, a large DBC gives several
+schema parts and several data packets with the same timestamp. Ids never
+change meaning (names are only appended), so schema parts carry the id of
+their first name and fill in the consumer's table wherever they land.
+
+Packets (msgpack arrays):
+    schema: [PACKET_SCHEMA, version, first id, [name, ...]]
+    data:   [PACKET_DATA, version, timestamp, [id, ...], [value, ...]]
+
+Usage example (consumer side):
+    decoder = CompactDecoder()
+    while True:
+        update = decoder.feed(sock.recv(65535))
+        if update is not None:
+            timestamp, changed = update
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+
+PACKET_SCHEMA = 0
+PACKET_DATA = 1
+
+# stays below a 1500 byte Ethernet MTU after IP/UDP headers, like sample_batch.MAX_DATAGRAM
+MAX_DATAGRAM = 1400
+# array headers, packet type, version and a float64 timestamp or first id
+_ENVELOPE = 32
+
+
+def _array_header(n: int) -> bytes:
+    if n < 16:
+        return bytes([0x90 | n])
+    if n < 0x10000:
+        return b"\xdc" + n.to_bytes(2, "big")
+    return b"\xdd" + n.to_bytes(4, "big")
+
+
+def _changed(old: Any, new: Any) -> bool:
+    # NaN never equals itself, a NaN that stays NaN is not a change
+    return old != new and not (old != old and new != new)
+
+
+class CompactEncoder(object):
+    """turns {name: value} updates into schema and change-only data packets"""
+
+    def __init__(self, schema_period: float = 2.0, max_datagram: int = MAX_DATAGRAM) -> None:
+        self.schema_period = schema_period
+        self.max_datagram = max_datagram
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.version = 0
+        self.last_values: Dict[int, Any] = {}
+        self.last_schema = -float("inf")
+        self.packer = msgpack.Packer()
+        self.schema_packets_sent = 0
+        self.data_packets_sent = 0
+
+    def schema_packets(self) -> List[bytes]:
+        """the whole name table in parts of at most max_datagram bytes"""
+        pack = self.packer.pack
+        head = pack(PACKET_SCHEMA) + pack(self.version)
+        packets = []
+        for first, names in self._split([pack(name) for name in self.names]):
+            packets.append(_array_header(4) + head + pack(first) + _array_header(len(names)) + b"".join(names))
+        return packets
+
+    def _split(self, entries: List[bytes], sizes: Optional[List[int]] = None) -> List[Tuple[int, List[bytes]]]:
+        """(index of the first entry, entries) runs that fit a datagram each"""
+        limit = self.max_datagram - _ENVELOPE
+        runs: List[Tuple[int, List[bytes]]] = []
+        size = limit + 1
+        for i, entry in enumerate(entries):
+            n = len(entry) if sizes is None else sizes[i]
+            if size + n > limit:
+                runs.append((i, []))
+                size = 0
+            runs[-1][1].append(entry)
+            size += n
+        return runs
+
+    def data_packets(self, timestamp: float, ids: List[int], values: List[Any]) -> List[bytes]:
+        """data packets of at most max_datagram bytes, each value packed once"""
+        pack = self.packer.pack
+        head = pack(PACKET_DATA) + pack(self.version) + pack(timestamp)
+        pairs = [(pack(i), pack(value)) for i, value in zip(ids, values)]
+        packets = []
+        for _, run in self._split(pairs, [len(i) + len(v) for i, v in pairs]):
+            packets.append(_array_header(5) + head + _array_header(len(run)) + b"".join(i for i, _ in run)
+                           + _array_header(len(run)) + b"".join(v for _, v in run))
+        return packets
+
+    def encode(self, timestamp: float, fields: Dict[str, Any], now: Optional[float] = None) -> List[bytes]:
+        """
+        packets to send for one update, a schema packet first when the name
+        set grew or schema_period elapsed (then all known values are re-sent)
+        """
+        if now is None:
+            now = time.monotonic()
+        ids = self.ids
+        grew = False
+        for name in fields:
+            if name not in ids:
+                ids[name] = len(self.names)
+                self.names.append(name)
+                grew = True
+        if grew:
+            self.version = (self.version + 1) & 0xFFFF
+
+        packets = []
+        keyframe = grew or now - self.last_schema >= self.schema_period
+        if keyframe:
+            schema = self.schema_packets()
+            packets.extend(schema)
+            self.schema_packets_sent += len(schema)
+            self.last_schema = now
+
+        last_values = self.last_values
+        out_ids = []
+        out_values = []
+        for name, value in fields.items():
+            i = ids[name]
+            if i in last_values and not _changed(last_values[i], value):
+                continue
+            last_values[i] = value
+            out_ids.append(i)
+            out_values.append(value)
+        if keyframe:
+            # late consumers also need the values that did not change
+            sent = set(out_ids)
+            for i, value in last_values.items():
+                if i not in sent:
+                    out_ids.append(i)
+                    out_values.append(value)
+
+        if out_ids:
+            data = self.data_packets(timestamp, out_ids, out_values)
+            packets.extend(data)
+            self.data_packets_sent += len(data)
+        return packets
+
+
+class CompactDecoder(object):
+    """
+    consumer side of CompactEncoder, keeps the name table and the last
+    value of every signal (in values), data packets with an id whose name
+    has not arrived yet are dropped and counted
+    """
+
+    def __init__(self) -> None:
+        self.version: Optional[int] = None
+        self.names: List[Optional[str]] = []
+        self.values: Dict[str, Any] = {}
+        self.unknown_schema = 0
+
+    def feed(self, packet: bytes) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """(timestamp, changed fields) for a data packet, None otherwise"""
+        msg = msgpack.unpackb(packet)
+        kind = msg[0]
+        if kind == PACKET_SCHEMA:
+            _, self.version, first, names = msg
+            end = first + len(names)
+            if end > len(self.names):
+                self.names.extend([None] * (end - len(self.names)))
+            self.names[first:end] = names
+            return None
+        if kind != PACKET_DATA:
+            raise ValueError(f"unknown compact packet type {kind}")
+
+        _, version, timestamp, ids, values = msg
+        names = self.names
+        if any(i >= len(names) or names[i] is None for i in ids):
+            self.unknown_schema += 1
+            return None
+        changed = {names[i]: value for i, value in zip(ids, values)}
+        self.values.update(changed)
+        return timestamp, changed
@@ -5,15 +5,19 @@ Generated from: ('mavmc.xml',)
 
 Note: this file has been auto-generated. DO NOT EDIT
 """
+import asyncio
+import collections
 import hashlib
 import json
 import logging
+import operator
 import os
+import re
 import struct
 import sys
 import time
 from builtins import object, range
-from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Type, Union
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Type, Union
 
 WIRE_PROTOCOL_VERSION = "1.0"
 DIALECT = "mavmc_dialect"
@@ -27,6 +31,9 @@ MAVLINK_SIGNATURE_BLOCK_LEN = 13
 
 MAVLINK_IFLAG_SIGNED = 0x01
 
+# matches either start of frame marker, used to skip garbage in one step
+PROTOCOL_MARKER_RE = re.compile(b"[\xfd\xfe]")
+
 logger = logging.getLogger(__name__)
 
 # allow MAV_IGNORE_CRC=1 to ignore CRC, allowing some
@@ -58,6 +65,18 @@ except Exception:
 BytesLike = Union[List[int], Tuple[int], bytes, bytearray, str]
 
 
+def _x25crc_make_table() -> Tuple[int, ...]:
+    """per byte lookup table of the CRC-16/MCRF4XX update from checksum.h"""
+    table = []
+    for i in range(256):
+        tmp = (i ^ (i << 4)) & 0xFF
+        table.append(((tmp << 8) ^ (tmp << 3) ^ (tmp >> 4)) & 0xFFFF)
+    return tuple(table)
+
+
+X25CRC_TABLE = _x25crc_make_table()
+
+
 class _x25crc_slow(object):
     """CRC-16/MCRF4XX - based on checksum.h from mavlink library"""
 
@@ -73,11 +92,10 @@ class _x25crc_slow(object):
         if isinstance(buf, str):
             buf = buf.encode()
 
+        table = X25CRC_TABLE
         accum = self.crc
         for b in buf:
-            tmp = b ^ (accum & 0xFF)
-            tmp = (tmp ^ (tmp << 4)) & 0xFF
-            accum = (accum >> 8) ^ (tmp << 8) ^ (tmp << 3) ^ (tmp >> 4)
+            accum = (accum >> 8) ^ table[(accum ^ b) & 0xFF]
         self.crc = accum
 
 
@@ -102,6 +120,51 @@ class _x25crc_fast(object):
 
 x25crc = _x25crc_fast if mcrf4xx is not None else _x25crc_slow
 
+def x25crc_update(crc: int, buf: Union[bytes, bytearray, memoryview], start: int = 0, end: Optional[int] = None) -> int:
+    """accumulate buf[start:end] into crc, without copying the slice"""
+    table = X25CRC_TABLE
+    for b in memoryview(buf)[start:end]:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+def x25crc_frame(buf: Union[bytes, bytearray, memoryview], start: int, end: int, crc_extra: int, seed: Optional[int] = None) -> int:
+    """MAVLink checksum of buf[start:end] followed by the crc_extra byte, seed as from x25crc_seed"""
+    if seed is None:
+        seed = x25crc_seed(end - start, crc_extra)
+    if mcrf4xx is not None:
+        # fastcrc reads any buffer, the memoryview slice is not copied
+        crc = mcrf4xx(memoryview(buf)[start:end], 0)
+    else:
+        crc = x25crc_update(0, buf, start, end)
+    return ((crc >> 8) ^ X25CRC_TABLE[crc & 0xFF]) ^ seed
+
+
+# The CRC is linear, so the checksum of a frame body followed by crc_extra
+# splits into a part that depends only on the body length and crc_extra
+# (the seed, which also absorbs the 0xFFFF initial value) and the CRC of the
+# body itself started from zero and shifted by one zero byte:
+#
+#   crc(0xFFFF, body + [extra]) == seed(len(body), extra) ^ step0(crc(0, body))
+#
+# This lets frames be checked without materializing crc_extra anywhere and
+# lets many frames of one type share a precomputed seed.
+_x25crc_seed_cache: Dict[Tuple[int, int], int] = {}
+
+
+def x25crc_seed(length: int, crc_extra: int) -> int:
+    """CRC of length zero bytes followed by crc_extra, starting from 0xFFFF"""
+    key = (length, crc_extra)
+    seed = _x25crc_seed_cache.get(key)
+    if seed is None:
+        table = X25CRC_TABLE
+        seed = 0xFFFF
+        for _ in range(length):
+            seed = (seed >> 8) ^ table[seed & 0xFF]
+        seed = (seed >> 8) ^ table[(seed ^ crc_extra) & 0xFF]
+        _x25crc_seed_cache[key] = seed
+    return seed
+
 
 class MAVLink_header(object):
     """MAVLink message header"""
@@ -230,7 +293,7 @@ class MAVLink_message(object):
         if other is None:
             return False
 
-        if not isinstance(other, MAVLink_message):
+        if not isinstance(other, (MAVLink_message, MAVLink_compact_message)):
             return False
 
         if self.get_type() != other.get_type():
@@ -298,11 +361,7 @@ class MAVLink_message(object):
         )
         self._msgbuf = bytearray(self._header.pack(force_mavlink1=force_mavlink1))
         self._msgbuf += self._payload
-        crc = x25crc(self._msgbuf[1:])
-        if True:
-            # we are using CRC extra
-            crc.accumulate(struct.pack("B", crc_extra))
-        self._crc = crc.crc
+        self._crc = x25crc_frame(self._msgbuf, 1, len(self._msgbuf), crc_extra)
         self._msgbuf += struct.pack("<H", self._crc)
         if mav.signing.sign_outgoing and not force_mavlink1:
             self.sign_packet(mav)
@@ -767,12 +826,334 @@ mavlink_map: Dict[int, Type[MAVLink_message]] = {
 }
 
 
+def _make_field_decoder(msgtype: Type[MAVLink_message]) -> Callable[[Union[bytes, bytearray, memoryview], int, int], Sequence[Any]]:
+    """
+    build the payload field decode function of one message type
+
+    All layout analysis (field reordering, array slices, string fields) is
+    done here once, the returned closure only runs one unpack_from and an
+    itemgetter that yields the fields in constructor order.
+    """
+    unpack_from = msgtype.unpacker.unpack_from
+    unpack = msgtype.unpacker.unpack
+    size = msgtype.unpacker.size
+    len_map = msgtype.lengths
+    wire_starts = [sum(len_map[:order]) for order in range(len(len_map))]
+
+    items: List[Union[int, slice]] = []
+    array_fields: List[int] = []
+    string_fields: List[int] = []
+    for i, order in enumerate(msgtype.orders):
+        tip = wire_starts[order]
+        if len_map[order] == 1:
+            items.append(tip)
+            if msgtype.fieldtypes[i] == "char":
+                string_fields.append(i)
+        else:
+            items.append(slice(tip, tip + len_map[order]))
+            array_fields.append(i)
+
+    getter: Callable[[Tuple[Any, ...]], Tuple[Any, ...]]
+    if len(items) == 1:
+        getter = lambda t: (t[items[0]],)
+    else:
+        getter = operator.itemgetter(*items)
+
+    def padded(buf: Union[bytes, bytearray, memoryview], offset: int, mlen: int) -> Tuple[Any, ...]:
+        # zero pad truncated payloads to give right size
+        return unpack(bytes(buf[offset : offset + mlen]) + bytes(size - mlen))
+
+    decode_fields: Callable[[Union[bytes, bytearray, memoryview], int, int], Sequence[Any]]
+    if array_fields or string_fields:
+
+        def decode_fields(buf: Union[bytes, bytearray, memoryview], offset: int, mlen: int) -> Sequence[Any]:
+            fields = list(getter(unpack_from(buf, offset) if mlen >= size else padded(buf, offset, mlen)))
+            for i in array_fields:
+                fields[i] = list(fields[i])
+            for i in string_fields:
+                fields[i] = fields[i].rstrip(b"\x00")
+            return fields
+
+    elif items == list(range(len(items))):
+        # fields already are in wire order
+
+        def decode_fields(buf: Union[bytes, bytearray, memoryview], offset: int, mlen: int) -> Sequence[Any]:
+            return unpack_from(buf, offset) if mlen >= size else padded(buf, offset, mlen)
+
+    else:
+
+        def decode_fields(buf: Union[bytes, bytearray, memoryview], offset: int, mlen: int) -> Sequence[Any]:
+            return getter(unpack_from(buf, offset) if mlen >= size else padded(buf, offset, mlen))
+
+    return decode_fields
+
+
+def _make_payload_decoder(msgtype: Type[MAVLink_message]) -> Callable[[Union[bytes, bytearray, memoryview], int, int], MAVLink_message]:
+    """build the payload decode function of one message type, see _make_field_decoder"""
+    decode_fields = mavlink_field_decoders[msgtype.id]
+
+    def decode_payload(buf: Union[bytes, bytearray, memoryview], offset: int, mlen: int) -> MAVLink_message:
+        # Note that initializers don't follow the Liskov Substitution Principle
+        # therefore it can't be typechecked
+        return msgtype(*decode_fields(buf, offset, mlen))  # type: ignore
+
+    return decode_payload
+
+
+# specialized payload decoders, built once at import
+mavlink_field_decoders: Dict[int, Callable[[Union[bytes, bytearray, memoryview], int, int], Sequence[Any]]] = {msgId: _make_field_decoder(msgtype) for msgId, msgtype in mavlink_map.items()}
+mavlink_decoders: Dict[int, Callable[[Union[bytes, bytearray, memoryview], int, int], MAVLink_message]] = {msgId: _make_payload_decoder(msgtype) for msgId, msgtype in mavlink_map.items()}
+
+
+def _make_field_encoder(msgtype: Type[MAVLink_message]) -> Callable[[MAVLink_message], Sequence[Any]]:
+    """
+    build the inverse of _make_field_decoder: a function returning the
+    fields of a message in wire order, arrays flattened, ready for
+    Struct.pack_into
+    """
+    wire_fields: List[Tuple[str, int, bool]] = []
+    for order, name in enumerate(msgtype.ordered_fieldnames):
+        i = msgtype.orders.index(order)
+        wire_fields.append((name, msgtype.lengths[order], msgtype.fieldtypes[i] == "char"))
+
+    if all(length == 1 and not is_string for _, length, is_string in wire_fields):
+        if len(wire_fields) == 1:
+            name = wire_fields[0][0]
+            return lambda msg: (getattr(msg, name),)
+        return operator.attrgetter(*[name for name, _, _ in wire_fields])  # type: ignore
+
+    def encode_fields(msg: MAVLink_message) -> Sequence[Any]:
+        values: List[Any] = []
+        for name, length, is_string in wire_fields:
+            value = getattr(msg, name)
+            if length > 1:
+                values.extend(value[:length])
+            elif is_string and isinstance(value, str):
+                values.append(value.encode("ascii", errors="replace"))
+            else:
+                values.append(value)
+        return values
+
+    return encode_fields
+
+
+# wire order field getters for the zero-copy encoder, built once at import
+mavlink_field_encoders: Dict[int, Callable[[MAVLink_message], Sequence[Any]]] = {msgId: _make_field_encoder(msgtype) for msgId, msgtype in mavlink_map.items()}
+
+# MAVLink 1 header and checksum packers shared by all encoders
+_mav10_header_packer = struct.Struct("<BBBBBB")
+_mav_csum_packer = struct.Struct("<H")
+
+
+class MAVLink_compact_message(object):
+    """
+    compact decoded MAVLink message
+
+    Opt-in alternative to the MAVLink_message classes for high rate
+    receive paths (see MAVLink.set_compact_messages). It offers the same
+    getters, but lives in __slots__: the fields are kept as one sequence,
+    the frame bytes as one reference, and the header and payload are only
+    built when get_header() / get_payload() are called. char arrays are
+    left as bytes, format_attr() gives their text.
+    """
+
+    __slots__ = ("_frame", "_fields", "_crc", "_signed", "_link_id")
+
+    id = 0
+    msgname = ""
+    fieldnames: List[str] = []
+    # kept apart from id/msgname, which a field of the same name shadows
+    _msgId = 0
+    _type = ""
+    _fieldnames: List[str] = []
+    _instances: Optional[Dict[str, str]] = None
+
+    _frame: bytearray
+    _fields: Sequence[Any]
+    _crc: Optional[int]
+    _signed: bool
+    _link_id: Optional[int]
+
+    format_attr = MAVLink_message.format_attr
+    to_dict = MAVLink_message.to_dict
+    to_json = MAVLink_message.to_json
+    __str__ = MAVLink_message.__str__
+    __eq__ = MAVLink_message.__eq__
+    __ne__ = MAVLink_message.__ne__
+
+    def _header_offset(self) -> int:
+        """offset of seq in the frame, header fields follow it in both versions"""
+        return 4 if self._frame[0] == PROTOCOL_MARKER_V2 else 2
+
+    def get_msgbuf(self) -> bytearray:
+        return self._frame
+
+    def get_header(self) -> MAVLink_header:
+        frame = self._frame
+        if frame[0] == PROTOCOL_MARKER_V2:
+            return MAVLink_header(self._msgId, frame[2], frame[3], frame[1], frame[4], frame[5], frame[6])
+        return MAVLink_header(self._msgId, 0, 0, frame[1], frame[2], frame[3], frame[4])
+
+    def get_payload(self) -> bytearray:
+        hlen = HEADER_LEN_V2 if self._frame[0] == PROTOCOL_MARKER_V2 else HEADER_LEN_V1
+        return self._frame[hlen : hlen + self._frame[1]]
+
+    def get_crc(self) -> Optional[int]:
+        return self._crc
+
+    def get_fieldnames(self) -> List[str]:
+        return self._fieldnames
+
+    def get_type(self) -> str:
+        return self._type
+
+    def get_msgId(self) -> int:
+        return self._msgId
+
+    def get_srcSystem(self) -> int:
+        return self._frame[self._header_offset() + 1]
+
+    def get_srcComponent(self) -> int:
+        return self._frame[self._header_offset() + 2]
+
+    def get_seq(self) -> int:
+        return self._frame[self._header_offset()]
+
+    def get_signed(self) -> bool:
+        return self._signed
+
+    def get_link_id(self) -> Optional[int]:
+        return self._link_id
+
+    def to_message(self) -> MAVLink_message:
+        """convert to the full MAVLink_message class of this type"""
+        m = mavlink_map[self._msgId](*self._fields)  # type: ignore
+        m._msgbuf = self._frame
+        m._payload = self.get_payload()
+        m._crc = self._crc
+        m._header = self.get_header()
+        m._signed = self._signed
+        m._link_id = self._link_id
+        return m
+
+    def pack(self, mav: "MAVLink", force_mavlink1: bool = False) -> bytes:
+        return self.to_message().pack(mav, force_mavlink1=force_mavlink1)
+
+
+def _make_compact_class(msgtype: Type[MAVLink_message]) -> Type[MAVLink_compact_message]:
+    """build the compact class of one message type, fields are read through properties"""
+    namespace: Dict[str, Any] = {
+        "__slots__": (),
+        "__doc__": msgtype.__doc__,
+        "id": msgtype.id,
+        "msgname": msgtype.msgname,
+        "fieldnames": msgtype.fieldnames,
+        "_msgId": msgtype.id,
+        "_type": msgtype.msgname,
+        "_fieldnames": msgtype.fieldnames,
+    }
+    for i, name in enumerate(msgtype.fieldnames):
+        namespace[name] = property(lambda self, i=i: self._fields[i])
+    return type("MAVLink_%s_compact" % msgtype.msgname.lower(), (MAVLink_compact_message,), namespace)
+
+
+compact_map: Dict[int, Type[MAVLink_compact_message]] = {msgId: _make_compact_class(msgtype) for msgId, msgtype in mavlink_map.items()}
+
+
+class MAVLinkMessagePool(object):
+    """
+    free list of compact message objects of one type
+
+    Messages handed out by the parser are reused once they are given back
+    with MAVLink.release_message(), which avoids allocation churn on high
+    rate streams. A released message must not be used any more.
+    """
+
+    def __init__(self, msgtype: Type[MAVLink_compact_message], maxsize: int = 256) -> None:
+        self.msgtype = msgtype
+        self.maxsize = maxsize
+        self.free: List[MAVLink_compact_message] = []
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self) -> MAVLink_compact_message:
+        if self.free:
+            self.reused += 1
+            return self.free.pop()
+        self.allocated += 1
+        return self.msgtype.__new__(self.msgtype)
+
+    def release(self, msg: MAVLink_compact_message) -> None:
+        if len(self.free) < self.maxsize:
+            self.free.append(msg)
+
+
+# CRC seeds of full length MAVLink 1 frames, see x25crc_seed
+mavlink_crc_seeds: Dict[int, int] = {msgId: x25crc_seed(HEADER_LEN_V1 - 1 + msgtype.unpacker.size, msgtype.crc_extra) for msgId, msgtype in mavlink_map.items()}
+
+
+def mavlink_crc_seed(msgtype: Type[MAVLink_message], length: int) -> int:
+    """x25crc_seed of a msgtype frame body of length bytes, precomputed for full length MAVLink 1 frames"""
+    if length == HEADER_LEN_V1 - 1 + msgtype.unpacker.size:
+        return mavlink_crc_seeds[msgtype.id]
+    return x25crc_seed(length, msgtype.crc_extra)
+
+
+def x25crc_check_frames(buf: Union[bytes, bytearray, memoryview], offsets: Iterable[int]) -> List[bool]:
+    """
+    check the CRC of many complete frames in buf in one call
+
+    offsets are the positions of the frame markers, the frame lengths are
+    taken from the headers. Unknown message ids and truncated frames fail.
+    """
+    view = memoryview(buf)
+    n = len(view)
+    table = X25CRC_TABLE
+    ret: List[bool] = []
+    for off in offsets:
+        if n - off < HEADER_LEN_V1 + 2:
+            ret.append(False)
+            continue
+        if view[off] == PROTOCOL_MARKER_V2:
+            hlen = HEADER_LEN_V2
+            if n - off < hlen:
+                ret.append(False)
+                continue
+            msgId = view[off + 7] | (view[off + 8] << 8) | (view[off + 9] << 16)
+        else:
+            hlen = HEADER_LEN_V1
+            msgId = view[off + 5]
+        msgtype = mavlink_map.get(msgId)
+        end = off + hlen + view[off + 1]
+        if msgtype is None or end + 2 > n:
+            ret.append(False)
+            continue
+        if mcrf4xx is not None:
+            crc = mcrf4xx(view[off + 1 : end], 0)
+        else:
+            crc = 0
+            for b in view[off + 1 : end]:
+                crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+        crc = ((crc >> 8) ^ table[crc & 0xFF]) ^ mavlink_crc_seed(msgtype, end - off - 1)
+        ret.append(crc == (view[end] | (view[end + 1] << 8)))
+    return ret
+
+
 class MAVError(Exception):
     """MAVLink error class"""
 
-    def __init__(self, msg: str) -> None:
+    def __init__(self, msg: str, kind: str = "error") -> None:
         Exception.__init__(self, msg)
         self.message = msg
+        self.kind = kind
+
+
+class MAVLinkParseError(NamedTuple):
+    """compact record of one receive error, kept in MAVLink.recent_errors"""
+
+    kind: str
+    msgId: int
+    length: int
 
 
 class MAVLink_bad_data(MAVLink_message):
@@ -829,12 +1210,76 @@ class MAVLinkSigning(object):
         self.reject_count = 0
 
 
+class MAVLinkStreamStats(object):
+    """receive statistics of one (srcSystem, srcComponent) stream"""
+
+    def __init__(self) -> None:
+        self.last_seq = -1
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.msg_counts: Dict[int, int] = {}
+        self.msg_bytes: Dict[int, int] = {}
+        self.crc_errors: Dict[int, int] = {}
+
+    def update(self, seq: int, msgId: int, flen: int) -> None:
+        """account one valid frame, gaps in seq count as lost packets"""
+        if self.last_seq >= 0:
+            gap = (seq - self.last_seq) & 0xFF
+            if gap == 0:
+                self.duplicates += 1
+            else:
+                self.lost += gap - 1
+        self.last_seq = seq
+        self.packets += 1
+        self.bytes += flen
+        self.msg_counts[msgId] = self.msg_counts.get(msgId, 0) + 1
+        self.msg_bytes[msgId] = self.msg_bytes.get(msgId, 0) + flen
+
+    def loss_rate(self) -> float:
+        expected = self.packets + self.lost
+        return self.lost / expected if expected else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "lost": self.lost,
+            "duplicates": self.duplicates,
+            "loss_rate": self.loss_rate(),
+            "last_seq": self.last_seq,
+            "msg_counts": dict(self.msg_counts),
+            "msg_bytes": dict(self.msg_bytes),
+            "crc_errors": dict(self.crc_errors),
+        }
+
+
 MAVLinkV1Header = Tuple[bytes, int, int, int, int, int]
 MAVLinkV2Header = Tuple[bytes, int, int, int, int, int, int, int, int]
 
+def load_native() -> Optional[Any]:
+    """
+    import the optional _mavmc_native extension built from mavmc_native.c
+    (the generated C parser), None when it is not built
+    """
+    try:
+        import _mavmc_native  # type: ignore
+    except ImportError:
+        return None
+    return _mavmc_native
+
+
 class MAVLink(object):
     """MAVLink protocol handling class"""
 
+    # header/CRC/signature unpackers are stateless, so all instances share them
+    mav20_unpacker = struct.Struct("<cBBBBBBHB")
+    mav10_unpacker = struct.Struct("<cBBBBB")
+    mav20_h3_unpacker = struct.Struct("BBB")
+    mav_csum_unpacker = struct.Struct("<H")
+    mav_sign_unpacker = struct.Struct("<IH")
+
     def __init__(self, file: Any, srcSystem: int = 0, srcComponent: int = 0, use_native: bool = False) -> None:
         self.seq = 0
         self.file = file
@@ -862,11 +1307,27 @@ class MAVLink(object):
         self.total_receive_errors = 0
         self.startup_time = time.time()
         self.signing = MAVLinkSigning()
-        self.mav20_unpacker = struct.Struct("<cBBBBBBHB")
-        self.mav10_unpacker = struct.Struct("<cBBBBB")
-        self.mav20_h3_unpacker = struct.Struct("BBB")
-        self.mav_csum_unpacker = struct.Struct("<H")
-        self.mav_sign_unpacker = struct.Struct("<IH")
+        self.tx_buf = bytearray()
+        self.compact_messages = False
+        self.message_pools: Dict[int, MAVLinkMessagePool] = {}
+        self.subscribed_msgids: Optional[FrozenSet[int]] = None
+        self.filter_verify_crc = True
+        self.have_skipped_frame = False
+        self.total_packets_filtered = 0
+        self.filtered_counts: Dict[int, int] = {}
+        self.fast_resync = False
+        self.error_counts: Dict[str, int] = {}
+        self.recent_errors: Deque[MAVLinkParseError] = collections.deque(maxlen=64)
+        self.track_stats = True
+        self.stream_stats: Dict[Tuple[int, int], MAVLinkStreamStats] = {}
+        self.crc_errors_by_msgid: Dict[int, int] = {}
+        self.native_parser: Optional[Any] = None
+        if use_native:
+            native = load_native()
+            if native is not None:
+                self.native_parser = native.Parser()
+            else:
+                logger.info("_mavmc_native is not built, using the Python parser")
 
     def set_callback(self, callback: Callable[..., None], *args: Any, **kwargs: Any) -> None:
         self.callback = callback
@@ -878,6 +1339,133 @@ class MAVLink(object):
         self.send_callback_args = args
         self.send_callback_kwargs = kwargs
 
+    def set_compact_messages(self, enabled: bool = True, pool_size: int = 0) -> None:
+        """
+        decode into MAVLink_compact_message objects instead of the full
+        message classes, optionally pooling GENERIC_CAN_FRAME objects (give
+        them back with release_message() once done with them)
+        """
+        self.compact_messages = enabled
+        self.message_pools = {}
+        if enabled and pool_size > 0:
+            msgId = MAVLINK_MSG_ID_GENERIC_CAN_FRAME
+            self.message_pools[msgId] = MAVLinkMessagePool(compact_map[msgId], pool_size)
+
+    def release_message(self, msg: Union[MAVLink_message, MAVLink_compact_message]) -> None:
+        """return a decoded compact message to its pool, if it has one"""
+        pool = self.message_pools.get(msg.get_msgId())
+        if pool is not None and isinstance(msg, pool.msgtype):
+            pool.release(msg)
+
+    def set_subscription(self, msgids: Optional[Iterable[int]], verify_crc: bool = True) -> None:
+        """
+        only fully decode frames with the given message ids, None decodes
+        everything again
+
+        Frames outside the subscription never get a message object. With
+        verify_crc they are still CRC checked (failures count as receive
+        errors), otherwise they are skipped on the header alone. Either way
+        they are counted in total_packets_filtered and filtered_counts.
+        """
+        self.subscribed_msgids = frozenset(msgids) if msgids is not None else None
+        self.filter_verify_crc = verify_crc
+
+    def __record_error(self, kind: str, msgId: int, length: int) -> None:
+        """count a receive error and keep a compact record of it"""
+        self.total_receive_errors += 1
+        self.error_counts[kind] = self.error_counts.get(kind, 0) + 1
+        self.recent_errors.append(MAVLinkParseError(kind, msgId, length))
+
+    def __record_crc_error(self, buf: bytearray, start: int, msgId: int) -> None:
+        """attribute a CRC failure to its msgid, and to its stream if that is already known"""
+        self.crc_errors_by_msgid[msgId] = self.crc_errors_by_msgid.get(msgId, 0) + 1
+        if buf[start] == PROTOCOL_MARKER_V2:
+            key = (buf[start + 5], buf[start + 6])
+        else:
+            key = (buf[start + 3], buf[start + 4])
+        stats = self.stream_stats.get(key)
+        if stats is not None:
+            stats.crc_errors[msgId] = stats.crc_errors.get(msgId, 0) + 1
+
+    def __record_frame(self, srcSystem: int, srcComponent: int, seq: int, msgId: int, flen: int) -> None:
+        """account a valid frame in the statistics of its stream"""
+        key = (srcSystem, srcComponent)
+        stats = self.stream_stats.get(key)
+        if stats is None:
+            stats = self.stream_stats[key] = MAVLinkStreamStats()
+        stats.update(seq, msgId, flen)
+
+    def link_stats(self) -> Dict[str, Any]:
+        """snapshot of the receive statistics, per (srcSystem, srcComponent) stream and global"""
+        return {
+            "streams": {key: stats.snapshot() for key, stats in self.stream_stats.items()},
+            "crc_errors_by_msgid": dict(self.crc_errors_by_msgid),
+            "error_counts": dict(self.error_counts),
+            "packets_received": self.total_packets_received,
+            "packets_filtered": self.total_packets_filtered,
+            "bytes_received": self.total_bytes_received,
+            "receive_errors": self.total_receive_errors,
+        }
+
+    def reset_link_stats(self) -> None:
+        self.stream_stats = {}
+        self.crc_errors_by_msgid = {}
+
+    def __frame_msgid(self, buf: bytearray, start: int) -> int:
+        if buf[start] == PROTOCOL_MARKER_V2:
+            return buf[start + 7] | (buf[start + 8] << 8) | (buf[start + 9] << 16)
+        return buf[start + 5]
+
+    def __check_frame(self, buf: bytearray, start: int, flen: int) -> bool:
+        """
+        validate a complete frame at buf[start:] in place for fast_resync,
+        recording an error instead of raising when it is not a real frame
+        (bad incompat flags, a msgid not in this dialect or a CRC mismatch)
+        """
+        signature_len = 0
+        if buf[start] == PROTOCOL_MARKER_V2:
+            incompat_flags = buf[start + 2]
+            if incompat_flags & ~MAVLINK_IFLAG_SIGNED:
+                self.__record_error("flags", -1, flen)
+                return False
+            if incompat_flags & MAVLINK_IFLAG_SIGNED:
+                signature_len = MAVLINK_SIGNATURE_BLOCK_LEN
+        msgId = self.__frame_msgid(buf, start)
+        msgtype = mavlink_map.get(msgId)
+        if msgtype is None:
+            self.__record_error("msgid", msgId, flen)
+            return False
+        if not MAVLINK_IGNORE_CRC:
+            crc_end = start + flen - 2 - signature_len
+            if x25crc_frame(buf, start + 1, crc_end, msgtype.crc_extra, mavlink_crc_seed(msgtype, crc_end - start - 1)) != buf[crc_end] | (buf[crc_end + 1] << 8):
+                self.__record_error("crc", msgId, flen)
+                self.__record_crc_error(buf, start, msgId)
+                return False
+        return True
+
+    def __filter_frame(self, buf: bytearray, start: int, flen: int, crc_checked: bool = False) -> bool:
+        """check a complete frame at buf[start:] against the subscription, True if it was skipped"""
+        msgId = self.__frame_msgid(buf, start)
+        if msgId in self.subscribed_msgids:  # type: ignore
+            return False
+        msgtype = mavlink_map.get(msgId)
+        if self.filter_verify_crc and not crc_checked and msgtype is not None and not MAVLINK_IGNORE_CRC:
+            crc_end = start + flen - 2
+            if buf[start] == PROTOCOL_MARKER_V2 and buf[start + 2] & MAVLINK_IFLAG_SIGNED:
+                crc_end -= MAVLINK_SIGNATURE_BLOCK_LEN
+            if x25crc_frame(buf, start + 1, crc_end, msgtype.crc_extra, mavlink_crc_seed(msgtype, crc_end - start - 1)) != buf[crc_end] | (buf[crc_end + 1] << 8):
+                self.__record_error("crc", msgId, flen)
+                self.__record_crc_error(buf, start, msgId)
+                return True
+        if self.track_stats:
+            if buf[start] == PROTOCOL_MARKER_V2:
+                self.__record_frame(buf[start + 5], buf[start + 6], buf[start + 4], msgId, flen)
+            else:
+                self.__record_frame(buf[start + 3], buf[start + 4], buf[start + 2], msgId, flen)
+        self.total_packets_filtered += 1
+        self.filtered_counts[msgId] = self.filtered_counts.get(msgId, 0) + 1
+        return True
+
     def send(self, mavmsg: MAVLink_message, force_mavlink1: bool = False) -> None:
         """send a MAVLink message"""
         buf = mavmsg.pack(self, force_mavlink1=force_mavlink1)
@@ -888,6 +1476,63 @@ class MAVLink(object):
         if self.send_callback is not None and self.send_callback_args is not None and self.send_callback_kwargs is not None:
             self.send_callback(mavmsg, *self.send_callback_args, **self.send_callback_kwargs)
 
+    def encoded_size(self, mavmsg: MAVLink_message) -> int:
+        """number of bytes encode_into() writes for mavmsg"""
+        if self.signing.sign_outgoing or float(WIRE_PROTOCOL_VERSION) != 1.0 or mavmsg.get_msgId() not in mavlink_field_encoders:
+            return len(mavmsg.pack(self))
+        return HEADER_LEN_V1 + mavmsg.unpacker.size + 2
+
+    def encode_into(self, mavmsg: MAVLink_message, buf: bytearray, offset: int = 0) -> int:
+        """
+        encode mavmsg with the current seq straight into buf at offset,
+        returning the number of bytes written
+
+        Header, payload and checksum are written with Struct.pack_into and
+        the CRC is taken over the buffer in place, so no intermediate
+        bytearrays or header objects are built. Like pack(), this does not
+        advance seq. Signed or MAVLink 2 output falls back to pack().
+        """
+        msgId = mavmsg.get_msgId()
+        encode_fields = mavlink_field_encoders.get(msgId)
+        if encode_fields is None or self.signing.sign_outgoing or float(WIRE_PROTOCOL_VERSION) != 1.0:
+            data = mavmsg.pack(self)
+            buf[offset : offset + len(data)] = data
+            return len(data)
+        payloader = mavmsg.unpacker
+        mlen = payloader.size
+        _mav10_header_packer.pack_into(buf, offset, PROTOCOL_MARKER_V1, mlen, self.seq, self.srcSystem, self.srcComponent, msgId)
+        payloader.pack_into(buf, offset + HEADER_LEN_V1, *encode_fields(mavmsg))
+        end = offset + HEADER_LEN_V1 + mlen
+        crc = x25crc_frame(buf, offset + 1, end, mavmsg.crc_extra, mavlink_crc_seeds[msgId])
+        _mav_csum_packer.pack_into(buf, end, crc)
+        mavmsg._crc = crc
+        return end + 2 - offset
+
+    def send_many(self, mavmsgs: Sequence[MAVLink_message]) -> int:
+        """
+        encode a batch of messages back to back into one reusable buffer
+        and write it to the file with a single call, returning the number
+        of bytes written
+        """
+        total = 0
+        for mavmsg in mavmsgs:
+            total += self.encoded_size(mavmsg)
+        if len(self.tx_buf) < total:
+            self.tx_buf = bytearray(total)
+        buf = self.tx_buf
+        offset = 0
+        for mavmsg in mavmsgs:
+            offset += self.encode_into(mavmsg, buf, offset)
+            self.seq = (self.seq + 1) % 256
+        if offset:
+            self.file.write(memoryview(buf)[:offset])
+        self.total_packets_sent += len(mavmsgs)
+        self.total_bytes_sent += offset
+        if self.send_callback is not None and self.send_callback_args is not None and self.send_callback_kwargs is not None:
+            for mavmsg in mavmsgs:
+                self.send_callback(mavmsg, *self.send_callback_args, **self.send_callback_kwargs)
+        return offset
+
     def buf_len(self) -> int:
         return len(self.buf) - self.buf_index
 
@@ -911,6 +1556,9 @@ class MAVLink(object):
         self.total_bytes_received += len(c)
 
         m = self.__parse_char_legacy()
+        while m is None and self.have_skipped_frame:
+            # keep going past frames skipped by the subscription or by a resync
+            m = self.__parse_char_legacy()
 
         if m is not None:
             self.total_packets_received += 1
@@ -926,27 +1574,40 @@ class MAVLink(object):
 
     def __parse_char_legacy(self) -> Optional[MAVLink_message]:
         """input some data bytes, possibly returning a new message"""
+        self.have_skipped_frame = False
         header_len = HEADER_LEN_V1
         if self.buf_len() >= 1 and self.buf[self.buf_index] == PROTOCOL_MARKER_V2:
             header_len = HEADER_LEN_V2
 
         m: Optional[MAVLink_message] = None
         if self.buf_len() >= 1 and self.buf[self.buf_index] != PROTOCOL_MARKER_V1 and self.buf[self.buf_index] != PROTOCOL_MARKER_V2:
-            magic = self.buf[self.buf_index]
-            self.buf_index += 1
-            if self.robust_parsing:
-                invalid_prefix_start = self.buf_index - 1
-                while self.buf_len() >= 1 and self.buf[self.buf_index] != PROTOCOL_MARKER_V1 and self.buf[self.buf_index] != PROTOCOL_MARKER_V2:
-                    self.buf_index += 1
-                m = MAVLink_bad_data(self.buf[invalid_prefix_start : self.buf_index], "Bad prefix")
-                self.expected_length = header_len + 2
+            if self.fast_resync:
+                # jump straight to the next marker, counting the whole run once
+                found = PROTOCOL_MARKER_RE.search(self.buf, self.buf_index)
+                end = found.start() if found is not None else len(self.buf)
+                if not self.have_prefix_error:
+                    self.have_prefix_error = True
+                    self.__record_error("prefix", -1, end - self.buf_index)
+                self.buf_index = end
+                if found is None:
+                    return None
+                header_len = HEADER_LEN_V2 if self.buf[end] == PROTOCOL_MARKER_V2 else HEADER_LEN_V1
+            else:
+                magic = self.buf[self.buf_index]
+                self.buf_index += 1
+                if self.robust_parsing:
+                    invalid_prefix_start = self.buf_index - 1
+                    while self.buf_len() >= 1 and self.buf[self.buf_index] != PROTOCOL_MARKER_V1 and self.buf[self.buf_index] != PROTOCOL_MARKER_V2:
+                        self.buf_index += 1
+                    m = MAVLink_bad_data(self.buf[invalid_prefix_start : self.buf_index], "Bad prefix")
+                    self.expected_length = header_len + 2
+                    self.total_receive_errors += 1
+                    return m
+                if self.have_prefix_error:
+                    return None
+                self.have_prefix_error = True
                 self.total_receive_errors += 1
-                return m
-            if self.have_prefix_error:
-                return None
-            self.have_prefix_error = True
-            self.total_receive_errors += 1
-            raise MAVError("invalid MAVLink prefix '%s'" % magic)
+                raise MAVError("invalid MAVLink prefix '%s'" % magic, "prefix")
         self.have_prefix_error = False
         if self.buf_len() >= 3:
             sbuf = self.buf[self.buf_index : 3 + self.buf_index]
@@ -956,24 +1617,167 @@ class MAVLink(object):
                 self.expected_length += MAVLINK_SIGNATURE_BLOCK_LEN
             self.expected_length += header_len + 2
         if self.expected_length >= (header_len + 2) and self.buf_len() >= self.expected_length:
+            if self.fast_resync and not self.__check_frame(self.buf, self.buf_index, self.expected_length):
+                # a false marker, resume right after it
+                self.buf_index += 1
+                self.expected_length = header_len + 2
+                self.have_skipped_frame = True
+                return None
+            if self.subscribed_msgids is not None and self.__filter_frame(self.buf, self.buf_index, self.expected_length, self.fast_resync):
+                self.buf_index += self.expected_length
+                self.expected_length = header_len + 2
+                self.have_skipped_frame = True
+                return None
             mbuf = self.buf[self.buf_index : self.buf_index + self.expected_length]
             self.buf_index += self.expected_length
             self.expected_length = header_len + 2
             if self.robust_parsing:
                 try:
                     if magic == PROTOCOL_MARKER_V2 and (incompat_flags & ~MAVLINK_IFLAG_SIGNED) != 0:
-                        raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length))
-                    m = self.decode(mbuf)
+                        raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length), "flags")
+                    m = self.decode(mbuf, crc_checked=self.fast_resync)
                 except MAVError as reason:
                     m = MAVLink_bad_data(mbuf, reason.message)
                     self.total_receive_errors += 1
+            elif self.fast_resync:
+                try:
+                    m = self.decode(mbuf, crc_checked=True)
+                except MAVError as reason:
+                    self.__record_error(reason.kind, self.__frame_msgid(mbuf, 0), len(mbuf))
+                    self.have_skipped_frame = True
             else:
                 if magic == PROTOCOL_MARKER_V2 and (incompat_flags & ~MAVLINK_IFLAG_SIGNED) != 0:
-                    raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length))
+                    raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length), "flags")
                 m = self.decode(mbuf)
             return m
         return None
 
+    def parse_chunk(self, data: Union[bytes, bytearray, memoryview]) -> List[MAVLink_message]:
+        """
+        input a whole chunk of data bytes (e.g. one serial read), returning
+        every complete message in it
+
+        The buffer is scanned by offset, garbage between frames is skipped
+        with a single regex search and a trailing partial frame is kept for
+        the next call. Errors never raise here, they are counted in
+        total_receive_errors and error_counts, recorded in recent_errors
+        (and returned as MAVLink_bad_data when robust_parsing is set), so
+        one bad frame does not lose the rest of the chunk.
+
+        With use_native (and the extension built) framing and CRC checks run
+        in the generated C parser, see __parse_chunk_native().
+
+        With fast_resync a frame that fails validation is treated as a false
+        marker: parsing resumes one byte after it instead of dropping the
+        whole claimed frame, so a real frame hidden behind noise is found
+        without going back over bytes before the marker.
+        """
+        if self.native_parser is not None and not self.robust_parsing and self.signing.secret_key is None:
+            return self.__parse_chunk_native(data)
+
+        buf = self.buf
+        if self.buf_index != 0:
+            del buf[: self.buf_index]
+            self.buf_index = 0
+        buf += data
+        self.total_bytes_received += len(data)
+
+        ret: List[MAVLink_message] = []
+        n = len(buf)
+        idx = 0
+        fast_resync = self.fast_resync
+        self.expected_length = HEADER_LEN_V1 + 2
+        while idx < n:
+            magic = buf[idx]
+            if magic != PROTOCOL_MARKER_V1 and magic != PROTOCOL_MARKER_V2:
+                found = PROTOCOL_MARKER_RE.search(buf, idx)
+                end = found.start() if found is not None else n
+                if self.robust_parsing:
+                    self.__record_error("prefix", -1, end - idx)
+                    ret.append(MAVLink_bad_data(buf[idx:end], "Bad prefix"))
+                elif not self.have_prefix_error:
+                    self.have_prefix_error = True
+                    self.__record_error("prefix", -1, end - idx)
+                idx = end
+                continue
+            self.have_prefix_error = False
+            if n - idx < 3:
+                break
+            if magic == PROTOCOL_MARKER_V2:
+                incompat_flags = buf[idx + 2]
+                flen = buf[idx + 1] + HEADER_LEN_V2 + 2
+                if incompat_flags & MAVLINK_IFLAG_SIGNED:
+                    flen += MAVLINK_SIGNATURE_BLOCK_LEN
+            else:
+                incompat_flags = 0
+                flen = buf[idx + 1] + HEADER_LEN_V1 + 2
+            if n - idx < flen:
+                self.expected_length = flen
+                break
+            if fast_resync and not self.__check_frame(buf, idx, flen):
+                if self.robust_parsing:
+                    ret.append(MAVLink_bad_data(buf[idx : idx + 1], "False marker"))
+                idx += 1
+                continue
+            if self.subscribed_msgids is not None and self.__filter_frame(buf, idx, flen, fast_resync):
+                idx += flen
+                continue
+            mbuf = buf[idx : idx + flen]
+            idx += flen
+            try:
+                if magic == PROTOCOL_MARKER_V2 and (incompat_flags & ~MAVLINK_IFLAG_SIGNED) != 0:
+                    raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, flen), "flags")
+                m = self.decode(mbuf, crc_checked=fast_resync)
+            except MAVError as reason:
+                self.__record_error(reason.kind, self.__frame_msgid(mbuf, 0), flen)
+                if not self.robust_parsing:
+                    continue
+                m = MAVLink_bad_data(mbuf, reason.message)
+            self.total_packets_received += 1
+            self.__callbacks(m)
+            ret.append(m)
+
+        if idx != 0:
+            del buf[:idx]
+        return ret
+
+    def __parse_chunk_native(self, data: Union[bytes, bytearray, memoryview]) -> List[MAVLink_message]:
+        """
+        parse_chunk() on the native parser: the C state machine frames and
+        CRC checks MAVLink 1 frames (it keeps its own partial frame between
+        calls and resyncs the way the C library does), only good frames come
+        back to be decoded here
+        """
+        native = self.native_parser
+        crc_errors = native.crc_errors  # type: ignore
+        parse_errors = native.parse_errors  # type: ignore
+        self.total_bytes_received += len(data)
+
+        ret: List[MAVLink_message] = []
+        subscribed = self.subscribed_msgids
+        for msgId, srcSystem, srcComponent, seq, frame in native.parse(data):  # type: ignore
+            if subscribed is not None and msgId not in subscribed:
+                if self.track_stats:
+                    self.__record_frame(srcSystem, srcComponent, seq, msgId, len(frame))
+                self.total_packets_filtered += 1
+                self.filtered_counts[msgId] = self.filtered_counts.get(msgId, 0) + 1
+                continue
+            try:
+                m = self.decode(bytearray(frame), crc_checked=True)
+            except MAVError as reason:
+                self.__record_error(reason.kind, msgId, len(frame))
+                continue
+            self.total_packets_received += 1
+            self.__callbacks(m)
+            ret.append(m)
+
+        # the C parser only counts failures, there is no msgid or length to record
+        for _ in range(native.crc_errors - crc_errors):  # type: ignore
+            self.__record_error("crc", -1, 0)
+        for _ in range(native.parse_errors - parse_errors):  # type: ignore
+            self.__record_error("length", -1, 0)
+        return ret
+
     def parse_buffer(self, s: Sequence[int]) -> Optional[List[MAVLink_message]]:
         """input some data bytes, possibly returning a list of new messages"""
         m = self.parse_char(s)
@@ -1028,15 +1832,15 @@ class MAVLink(object):
         self.signing.timestamp = max(self.signing.timestamp, timestamp)
         return True
 
-    def decode(self, msgbuf: bytearray) -> MAVLink_message:
-        """decode a buffer as a MAVLink message"""
+    def decode(self, msgbuf: bytearray, crc_checked: bool = False) -> MAVLink_message:
+        """decode a buffer as a MAVLink message, crc_checked skips a CRC check the caller already did"""
         # decode the header
         if msgbuf[0] != PROTOCOL_MARKER_V1:
             headerlen = 10
             try:
                 header_v2: MAVLinkV2Header = self.mav20_unpacker.unpack(msgbuf[:headerlen])
             except struct.error as emsg:
-                raise MAVError("Unable to unpack MAVLink header: %s" % emsg)
+                raise MAVError("Unable to unpack MAVLink header: %s" % emsg, "length")
             magic, mlen, incompat_flags, compat_flags, seq, srcSystem, srcComponent, msgIdlow, msgIdhigh = header_v2
             msgId = msgIdlow | (msgIdhigh << 16)
         else:
@@ -1044,7 +1848,7 @@ class MAVLink(object):
             try:
                 header_v1: MAVLinkV1Header = self.mav10_unpacker.unpack(msgbuf[:headerlen])
             except struct.error as emsg:
-                raise MAVError("Unable to unpack MAVLink header: %s" % emsg)
+                raise MAVError("Unable to unpack MAVLink header: %s" % emsg, "length")
             magic, mlen, seq, srcSystem, srcComponent, msgId = header_v1
             incompat_flags = 0
             compat_flags = 0
@@ -1055,31 +1859,32 @@ class MAVLink(object):
             signature_len = 0
 
         if ord(magic) != PROTOCOL_MARKER_V1 and ord(magic) != PROTOCOL_MARKER_V2:
-            raise MAVError("invalid MAVLink prefix '{}'".format(hex(ord(magic))))
+            raise MAVError("invalid MAVLink prefix '{}'".format(hex(ord(magic))), "prefix")
         if mlen != len(msgbuf) - (headerlen + 2 + signature_len):
-            raise MAVError("invalid MAVLink message length. Got %u expected %u, msgId=%u headerlen=%u" % (len(msgbuf) - (headerlen + 2 + signature_len), mlen, msgId, headerlen))
+            raise MAVError("invalid MAVLink message length. Got %u expected %u, msgId=%u headerlen=%u" % (len(msgbuf) - (headerlen + 2 + signature_len), mlen, msgId, headerlen), "length")
 
         if mapkey not in mavlink_map:
             return MAVLink_unknown(msgId, msgbuf)
 
         # decode the payload
         msgtype = mavlink_map[mapkey]
-        order_map = msgtype.orders
-        len_map = msgtype.lengths
         crc_extra = msgtype.crc_extra
 
         # decode the checksum
         try:
             crc: int = self.mav_csum_unpacker.unpack(msgbuf[-(2 + signature_len) :][:2])[0]
         except struct.error as emsg:
-            raise MAVError("Unable to unpack MAVLink CRC: %s" % emsg)
-        crcbuf = msgbuf[1 : -(2 + signature_len)]
-        if True:
-            # using CRC extra
-            crcbuf.append(crc_extra)
-        crc2 = x25crc(crcbuf)
-        if crc != crc2.crc and not MAVLINK_IGNORE_CRC:
-            raise MAVError("invalid MAVLink CRC in msgID %u 0x%04x should be 0x%04x" % (msgId, crc, crc2.crc))
+            raise MAVError("Unable to unpack MAVLink CRC: %s" % emsg, "length")
+        if crc_checked or MAVLINK_IGNORE_CRC:
+            crc2 = crc
+        else:
+            crc_end = len(msgbuf) - (2 + signature_len)
+            crc2 = x25crc_frame(msgbuf, 1, crc_end, crc_extra, mavlink_crc_seed(msgtype, crc_end - 1))
+        if crc != crc2:
+            self.__record_crc_error(msgbuf, 0, msgId)
+            raise MAVError("invalid MAVLink CRC in msgID %u 0x%04x should be 0x%04x" % (msgId, crc, crc2), "crc")
+        if self.track_stats:
+            self.__record_frame(srcSystem, srcComponent, seq, msgId, len(msgbuf))
 
         sig_ok = False
         if signature_len == MAVLINK_SIGNATURE_BLOCK_LEN:
@@ -1106,53 +1911,18 @@ class MAVLink(object):
                 else:
                     self.signing.reject_count += 1
             if not accept_signature:
-                raise MAVError("Invalid signature")
-
-        csize = msgtype.unpacker.size
-        mbuf = msgbuf[headerlen : -(2 + signature_len)]
-        if len(mbuf) < csize:
-            # zero pad to give right size
-            mbuf.extend([0] * (csize - len(mbuf)))
-        if len(mbuf) < csize:
-            raise MAVError("Bad message of type %s length %u needs %s" % (msgtype, len(mbuf), csize))
-        mbuf = mbuf[:csize]
-        try:
-            t: Tuple[Union[bytes, int, float], ...] = msgtype.unpacker.unpack(mbuf)
-        except struct.error as emsg:
-            raise MAVError("Unable to unpack MAVLink payload type=%s payloadLength=%u: %s" % (msgtype, len(mbuf), emsg))
-
-        tlist: List[Union[bytes, float, int, Sequence[Union[bytes, float, int]]]] = list(t)
-        # handle sorted fields
-        if True:
-            if sum(len_map) == len(len_map):
-                # message has no arrays in it
-                for i in range(0, len(tlist)):
-                    tlist[i] = t[order_map[i]]
-            else:
-                # message has some arrays
-                tlist = []
-                for i in range(0, len(order_map)):
-                    order = order_map[i]
-                    L = len_map[order]
-                    tip = sum(len_map[:order])
-                    field = t[tip]
-                    if L == 1 or isinstance(field, bytes):
-                        tlist.append(field)
-                    else:
-                        tlist.append(list(t[tip : (tip + L)]))
+                raise MAVError("Invalid signature", "signature")
 
-        # terminate any strings
-        for i, elem in enumerate(tlist):
-            if isinstance(elem, bytes):
-                tlist[i] = elem.rstrip(b"\x00")
+        if self.compact_messages:
+            return self.__decode_compact(msgbuf, mapkey, headerlen, mlen, crc, sig_ok)  # type: ignore
 
-        # construct the message object
+        # unpack straight into constructor order and construct the message object
         try:
-            # Note that initializers don't follow the Liskov Substitution Principle
-            # therefore it can't be typechecked
-            m = msgtype(*tlist)  # type: ignore
+            m = mavlink_decoders[mapkey](msgbuf, headerlen, mlen)
+        except struct.error as emsg:
+            raise MAVError("Unable to unpack MAVLink payload type=%s payloadLength=%u: %s" % (msgtype, mlen, emsg), "payload")
         except Exception as emsg:
-            raise MAVError("Unable to instantiate MAVLink message of type %s : %s" % (msgtype, emsg))
+            raise MAVError("Unable to instantiate MAVLink message of type %s : %s" % (msgtype, emsg), "payload")
         m._signed = sig_ok
         if m._signed:
             m._link_id = msgbuf[-13]
@@ -1162,6 +1932,25 @@ class MAVLink(object):
         m._header = MAVLink_header(msgId, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent)
         return m
 
+    def __decode_compact(self, msgbuf: bytearray, msgId: int, headerlen: int, mlen: int, crc: int, sig_ok: bool) -> MAVLink_compact_message:
+        """build a compact message from an already checked frame"""
+        try:
+            fields = mavlink_field_decoders[msgId](msgbuf, headerlen, mlen)
+        except struct.error as emsg:
+            raise MAVError("Unable to unpack MAVLink payload type=%s payloadLength=%u: %s" % (mavlink_map[msgId], mlen, emsg), "payload")
+        pool = self.message_pools.get(msgId)
+        if pool is not None:
+            m = pool.acquire()
+        else:
+            msgtype = compact_map[msgId]
+            m = msgtype.__new__(msgtype)
+        m._frame = msgbuf
+        m._fields = fields
+        m._crc = crc
+        m._signed = sig_ok
+        m._link_id = msgbuf[-13] if sig_ok else None
+        return m
+
     def heartbeat_encode(self, type: int, autopilot: int, base_mode: int, custom_mode: int, system_status: int, mavlink_version: int = 3) -> MAVLink_heartbeat_message:
         """
         The heartbeat message shows that a system or component is present and
@@ -1273,3 +2062,216 @@ class MAVLink(object):
 
         """
         self.send(self.debug_frame_encode(status, text), force_mavlink1=force_mavlink1)
+
+
+class MAVLinkMux(object):
+    """
+    demultiplexing parser for several links (radios, debug ports, replayed
+    captures) in one process
+
+    Every link gets its own parse state (buffer, expected_length, error
+    counters and per-stream statistics) keyed by a link id, created on the
+    first chunk from that link with the mux settings. All links share the
+    module level decoder tables and header Structs, so a link costs one
+    small parser object. Messages come out as one stream of
+    (link_id, rx_time, message) tuples.
+
+    Usage example:
+        mux = MAVLinkMux(fast_resync=True)
+        for link_id, rx_time, msg in mux.feed("radio0", ser.read(4096)):
+            ...
+    """
+
+    def __init__(self, fast_resync: bool = False, subscription: Optional[Iterable[int]] = None, compact_messages: bool = False, use_native: bool = False) -> None:
+        self.links: Dict[Any, MAVLink] = {}
+        self.fast_resync = fast_resync
+        self.subscription = frozenset(subscription) if subscription is not None else None
+        self.compact_messages = compact_messages
+        self.use_native = use_native
+
+    def link(self, link_id: Any) -> MAVLink:
+        """parse state of link_id, created on first use"""
+        mav = self.links.get(link_id)
+        if mav is None:
+            mav = MAVLink(None, use_native=self.use_native)
+            mav.fast_resync = self.fast_resync
+            if self.subscription is not None:
+                mav.set_subscription(self.subscription)
+            if self.compact_messages:
+                mav.set_compact_messages()
+            self.links[link_id] = mav
+        return mav
+
+    def remove_link(self, link_id: Any) -> None:
+        """forget a link together with any partial frame it had buffered"""
+        self.links.pop(link_id, None)
+
+    def feed(self, link_id: Any, data: Union[bytes, bytearray, memoryview], rx_time: Optional[float] = None) -> List[Tuple[Any, float, Union[MAVLink_message, MAVLink_compact_message]]]:
+        """parse a chunk received on link_id at rx_time (now if not given)"""
+        if rx_time is None:
+            rx_time = time.time()
+        return [(link_id, rx_time, m) for m in self.link(link_id).parse_chunk(data)]
+
+    def feed_many(self, chunks: Iterable[Tuple[Any, float, Union[bytes, bytearray, memoryview]]]) -> List[Tuple[Any, float, Union[MAVLink_message, MAVLink_compact_message]]]:
+        """
+        parse (link_id, rx_time, data) chunks from any links, returning one
+        stream ordered by rx_time (chunks with equal rx_time keep their order)
+        """
+        ret: List[Tuple[Any, float, Union[MAVLink_message, MAVLink_compact_message]]] = []
+        for link_id, rx_time, data in sorted(chunks, key=operator.itemgetter(1)):
+            ret.extend(self.feed(link_id, data, rx_time))
+        return ret
+
+    def link_stats(self) -> Dict[Any, Dict[str, Any]]:
+        """MAVLink.link_stats() of every link"""
+        return {link_id: mav.link_stats() for link_id, mav in self.links.items()}
+
+    def total_receive_errors(self) -> int:
+        return sum(mav.total_receive_errors for mav in self.links.values())
+
+
+class MAVLinkProtocol(asyncio.Protocol):
+    """
+    asyncio adapter for a MAVLink stream
+
+    Incoming data callbacks from any stream transport (serial through
+    pyserial-asyncio, pipes and ptys through loop.connect_read_pipe, TCP)
+    or datagram endpoint (UDP) are fed to MAVLink.parse_chunk() and the
+    decoded messages are handed to async consumers through a bounded queue:
+
+        async for msg in protocol:
+            ...
+
+    When the consumers fall behind the oldest queued message is dropped
+    (counted in dropped), so the freshest telemetry is always kept. send()
+    encodes with MAVLink.send_many() and waits while the transport has
+    paused writing.
+    """
+
+    def __init__(self, mav: Optional[MAVLink] = None, maxsize: int = 1024) -> None:
+        self.mav = mav if mav is not None else MAVLink(None)
+        self.mav.file = self
+        self.queue: "asyncio.Queue[Optional[Union[MAVLink_message, MAVLink_compact_message]]]" = asyncio.Queue(maxsize)
+        self.transport: Optional[asyncio.BaseTransport] = None
+        self.write_transport: Optional[asyncio.BaseTransport] = None
+        self.peer: Optional[Any] = None
+        self.datagram = False
+        self.dropped = 0
+        self.closed = False
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+
+    # --- transport callbacks ---
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        # selector datagram transports are not DatagramTransport subclasses on every version
+        self.datagram = hasattr(transport, "sendto")
+
+    def data_received(self, data: bytes) -> None:
+        for m in self.mav.parse_chunk(data):
+            self._put(m)
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        # replies go to whoever sent us the last datagram
+        self.peer = addr
+        self.data_received(data)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.warning("MAVLink datagram error: %s", exc)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.closed = True
+        self._can_write.set()
+        self._put(None)
+
+    def pause_writing(self) -> None:
+        self._can_write.clear()
+
+    def resume_writing(self) -> None:
+        self._can_write.set()
+
+    def _put(self, m: Optional[Union[MAVLink_message, MAVLink_compact_message]]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(m)
+
+    # --- consumer side ---
+
+    def __aiter__(self) -> "MAVLinkProtocol":
+        return self
+
+    async def __anext__(self) -> Union[MAVLink_message, MAVLink_compact_message]:
+        m = await self.queue.get()
+        if m is None:
+            # leave the end marker for any other consumer
+            self._put(None)
+            raise StopAsyncIteration
+        return m
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """file-like write used by the MAVLink sender"""
+        transport = self.write_transport if self.write_transport is not None else self.transport
+        if transport is None or self.closed:
+            raise MAVError("MAVLink transport is not connected")
+        if self.datagram and transport is self.transport:
+            # an endpoint opened with remote_addr is connected, otherwise reply to the last sender
+            if self.peer is None and transport.get_extra_info("peername") is None:
+                raise MAVError("no datagram peer yet")
+            transport.sendto(bytes(data), self.peer)  # type: ignore
+        else:
+            transport.write(bytes(data))  # type: ignore
+
+    async def send(self, *mavmsgs: MAVLink_message) -> int:
+        """encode and write messages once the transport accepts data, returning the bytes written"""
+        await self._can_write.wait()
+        return self.mav.send_many(mavmsgs)
+
+    def close(self) -> None:
+        for transport in (self.write_transport, self.transport):
+            if transport is not None:
+                transport.close()
+
+
+class _MAVLinkWriteFlowControl(asyncio.BaseProtocol):
+    """forwards write flow control of a separate write pipe to its MAVLinkProtocol"""
+
+    def __init__(self, protocol: MAVLinkProtocol) -> None:
+        self.protocol = protocol
+
+    def pause_writing(self) -> None:
+        self.protocol.pause_writing()
+
+    def resume_writing(self) -> None:
+        self.protocol.resume_writing()
+
+
+async def open_mavlink_datagram(local_addr: Optional[Tuple[str, int]] = None, remote_addr: Optional[Tuple[str, int]] = None, **kwargs: Any) -> MAVLinkProtocol:
+    """open a UDP MAVLink endpoint, kwargs go to MAVLinkProtocol"""
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_datagram_endpoint(lambda: MAVLinkProtocol(**kwargs), local_addr=local_addr, remote_addr=remote_addr)
+    if remote_addr is not None:
+        protocol.peer = None  # connected socket, sendto() must not name a peer
+    return protocol
+
+
+async def open_mavlink_serial(url: str, baudrate: int, **kwargs: Any) -> MAVLinkProtocol:
+    """open a serial port as a MAVLink stream, needs the optional pyserial-asyncio package"""
+    try:
+        import serial_asyncio  # type: ignore
+    except ImportError:
+        raise MAVError("open_mavlink_serial needs the pyserial-asyncio package")
+    loop = asyncio.get_running_loop()
+    _, protocol = await serial_asyncio.create_serial_connection(loop, lambda: MAVLinkProtocol(**kwargs), url, baudrate=baudrate)
+    return protocol
+
+
+async def open_mavlink_fd(fd: int, **kwargs: Any) -> MAVLinkProtocol:
+    """use a bidirectional file descriptor (e.g. a pty) as a MAVLink stream"""
+    loop = asyncio.get_running_loop()
+    protocol = MAVLinkProtocol(**kwargs)
+    await loop.connect_read_pipe(lambda: protocol, os.fdopen(fd, "rb", buffering=0, closefd=False))
+    write_transport, _ = await loop.connect_write_pipe(lambda: _MAVLinkWriteFlowControl(protocol), os.fdopen(os.dup(fd), "wb", buffering=0))
+    protocol.write_transport = write_transport
+    return protocol
@@ -0,0 +1,219 @@
+// mavmc_native.c
+// Optional native MAVLink v1.0 parse backend (dialect: mavmc) for Python.
+// Built from the same generated C headers as matlab_application/mavmc_deserializer_mex.c,
+// so Python and MATLAB share one parser. Loaded by MAVLink(..., use_native=True),
+// the pure Python parser is used when the module is not built.
+//
+// Build (from plot_juggler_bridge/):
+//   Linux/macOS:
+//     cc -O2 -shared -fPIC $(python3-config --includes) -I../generated mavmc_native.c -o _mavmc_native$(python3-config --extension-suffix)
+//   Windows (MSVC developer prompt, <py> = Python install dir):
+//     cl /O2 /LD /I<py>\include /I..\generated mavmc_native.c <py>\libs\python3X.lib /Fe_mavmc_native.pyd
+//
+// Parser.parse(bytes)       -> list of (msgid, sysid, compid, seq, frame) for frames with a good CRC
+// Parser.can_records(bytes) -> bytes of packed GENERIC_CAN_FRAME records
+//                              (layout of mavmc_batch.GENERIC_CAN_FRAME_DTYPE)
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include "structmember.h"
+
+#include <stdint.h>
+#include <string.h>
+
+#include "mavmc/mavlink.h"
+
+#define FRAME_HEADER_LEN 6
+#define CAN_RECORD_LEN   17   // timestamp u32, id u16, data u8[8], seq, sysid, compid
+
+typedef struct {
+    PyObject_HEAD
+    mavlink_message_t rxmsg;      // message being assembled
+    mavlink_status_t  status;     // parser state, one per object instead of per channel
+    mavlink_message_t msg;        // last complete message
+    mavlink_status_t  r_status;
+    unsigned long long packets;
+    unsigned long long crc_errors;
+    unsigned long long parse_errors;
+} ParserObject;
+
+static void parser_reset_state(ParserObject* self) {
+    memset(&self->rxmsg, 0, sizeof(self->rxmsg));
+    memset(&self->status, 0, sizeof(self->status));
+    memset(&self->msg, 0, sizeof(self->msg));
+    memset(&self->r_status, 0, sizeof(self->r_status));
+}
+
+// Feeds one byte, returns 1 when self->msg holds a frame with a good CRC
+static inline int parser_feed(ParserObject* self, uint8_t c) {
+    uint8_t r = mavlink_frame_char_buffer(&self->rxmsg, &self->status, c, &self->msg, &self->r_status);
+    self->parse_errors += self->r_status.packet_rx_drop_count;
+    if (r == MAVLINK_FRAMING_OK) {
+        self->packets++;
+        return 1;
+    }
+    if (r == MAVLINK_FRAMING_BAD_CRC) {
+        self->crc_errors++;
+    }
+    return 0;
+}
+
+// Rebuilds the wire frame (header, payload, CRC) of the last message
+static PyObject* frame_bytes(const mavlink_message_t* msg) {
+    Py_ssize_t n = FRAME_HEADER_LEN + msg->len + 2;
+    PyObject* frame = PyBytes_FromStringAndSize(NULL, n);
+    if (frame == NULL) return NULL;
+    uint8_t* p = (uint8_t*)PyBytes_AS_STRING(frame);
+    p[0] = msg->magic;
+    p[1] = msg->len;
+    p[2] = msg->seq;
+    p[3] = msg->sysid;
+    p[4] = msg->compid;
+    p[5] = msg->msgid;
+    memcpy(p + FRAME_HEADER_LEN, _MAV_PAYLOAD(msg), msg->len);
+    p[FRAME_HEADER_LEN + msg->len] = (uint8_t)(msg->checksum & 0xFF);
+    p[FRAME_HEADER_LEN + msg->len + 1] = (uint8_t)(msg->checksum >> 8);
+    return frame;
+}
+
+static PyObject* Parser_parse(ParserObject* self, PyObject* arg) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0) return NULL;
+
+    PyObject* out = PyList_New(0);
+    if (out == NULL) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    const uint8_t* data = (const uint8_t*)view.buf;
+    for (Py_ssize_t i = 0; i < view.len; ++i) {
+        if (!parser_feed(self, data[i])) continue;
+
+        const mavlink_message_t* msg = &self->msg;
+        PyObject* frame = frame_bytes(msg);
+        if (frame == NULL) goto fail;
+        PyObject* item = Py_BuildValue("(iiiiN)", msg->msgid, msg->sysid, msg->compid, msg->seq, frame);
+        if (item == NULL) goto fail;
+        if (PyList_Append(out, item) < 0) {
+            Py_DECREF(item);
+            goto fail;
+        }
+        Py_DECREF(item);
+    }
+    PyBuffer_Release(&view);
+    return out;
+
+fail:
+    PyBuffer_Release(&view);
+    Py_DECREF(out);
+    return NULL;
+}
+
+static PyObject* Parser_can_records(ParserObject* self, PyObject* arg) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0) return NULL;
+
+    // a GENERIC_CAN_FRAME takes 22 bytes on the wire, size the output for the worst case
+    Py_ssize_t cap = view.len / (FRAME_HEADER_LEN + MAVLINK_MSG_ID_GENERIC_CAN_FRAME_LEN + 2) + 1;
+    PyObject* out = PyBytes_FromStringAndSize(NULL, cap * CAN_RECORD_LEN);
+    if (out == NULL) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+    uint8_t* rec = (uint8_t*)PyBytes_AS_STRING(out);
+    Py_ssize_t k = 0;
+
+    const uint8_t* data = (const uint8_t*)view.buf;
+    Py_BEGIN_ALLOW_THREADS
+    for (Py_ssize_t i = 0; i < view.len; ++i) {
+        if (!parser_feed(self, data[i])) continue;
+
+        const mavlink_message_t* msg = &self->msg;
+        if (msg->msgid != MAVLINK_MSG_ID_GENERIC_CAN_FRAME || k == cap) continue;
+
+        mavlink_generic_can_frame_t f;
+        mavlink_msg_generic_can_frame_decode(msg, &f);
+        uint8_t* p = rec + k * CAN_RECORD_LEN;
+        memcpy(p, &f.timestamp, 4);   // little endian host, same as the wire
+        memcpy(p + 4, &f.id, 2);
+        memcpy(p + 6, f.data, 8);
+        p[14] = msg->seq;
+        p[15] = msg->sysid;
+        p[16] = msg->compid;
+        k++;
+    }
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
+
+    if (_PyBytes_Resize(&out, k * CAN_RECORD_LEN) < 0) return NULL;
+    return out;
+}
+
+static PyObject* Parser_reset(ParserObject* self, PyObject* Py_UNUSED(ignored)) {
+    parser_reset_state(self);
+    Py_RETURN_NONE;
+}
+
+static int Parser_init(ParserObject* self, PyObject* args, PyObject* kwds) {
+    static char* kwlist[] = {NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "", kwlist)) return -1;
+    parser_reset_state(self);
+    self->packets = 0;
+    self->crc_errors = 0;
+    self->parse_errors = 0;
+    return 0;
+}
+
+static PyMethodDef Parser_methods[] = {
+    {"parse", (PyCFunction)Parser_parse, METH_O,
+     "parse(data) -> list of (msgid, sysid, compid, seq, frame) for every good frame"},
+    {"can_records", (PyCFunction)Parser_can_records, METH_O,
+     "can_records(data) -> bytes of packed GENERIC_CAN_FRAME records, other messages are skipped"},
+    {"reset", (PyCFunction)Parser_reset, METH_NOARGS,
+     "drop any partial frame and restart the state machine"},
+    {NULL}
+};
+
+static PyMemberDef Parser_members[] = {
+    {"packets", T_ULONGLONG, offsetof(ParserObject, packets), READONLY, "frames with a good CRC"},
+    {"crc_errors", T_ULONGLONG, offsetof(ParserObject, crc_errors), READONLY, "frames with a bad CRC"},
+    {"parse_errors", T_ULONGLONG, offsetof(ParserObject, parse_errors), READONLY, "frames dropped while framing"},
+    {NULL}
+};
+
+static PyTypeObject ParserType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "_mavmc_native.Parser",
+    .tp_doc = "MAVLink v1.0 stream parser built on mavlink_frame_char_buffer",
+    .tp_basicsize = sizeof(ParserObject),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc)Parser_init,
+    .tp_methods = Parser_methods,
+    .tp_members = Parser_members,
+};
+
+static struct PyModuleDef native_module = {
+    PyModuleDef_HEAD_INIT,
+    .m_name = "_mavmc_native",
+    .m_doc = "native MAVLink parse backend for mavmc_dialect",
+    .m_size = -1,
+};
+
+PyMODINIT_FUNC PyInit__mavmc_native(void) {
+    if (PyType_Ready(&ParserType) < 0) return NULL;
+
+    PyObject* m = PyModule_Create(&native_module);
+    if (m == NULL) return NULL;
+
+    Py_INCREF(&ParserType);
+    if (PyModule_AddObject(m, "Parser", (PyObject*)&ParserType) < 0) {
+        Py_DECREF(&ParserType);
+        Py_DECREF(m);
+        return NULL;
+    }
+    PyModule_AddIntConstant(m, "CAN_RECORD_LEN", CAN_RECORD_LEN);
+    return m;
+}
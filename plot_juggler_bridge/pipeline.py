@@ -0,0 +1,208 @@
+"""
+Building blocks for the staged telemetry bridge.
+
+ChunkRing hands raw serial chunks from the reader thread to the decoder,
+StageTimer collects per stage timing and LatencyHistogram the distribution
+of per frame latencies between two points of the pipeline. All of them
+report their state as flat "bridge/..." signals that are published together
+with the telemetry.
+"""
+
+import collections
+import math
+import threading
+import time
+from typing import Any, Deque, Dict, List, Tuple
+
+
+class ChunkRing(object):
+    """
+    bounded ring of (rx_time, chunk) between the serial reader and the
+    decoder, the oldest chunk is dropped (and counted) when it is full so
+    the reader never blocks and the serial port keeps being drained
+    """
+
+    def __init__(self, maxlen: int = 256) -> None:
+        self.maxlen = maxlen
+        self.chunks: Deque[Tuple[float, bytes]] = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.pushed = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+        self.high_water = 0
+
+    def push(self, rx_time: float, chunk: bytes, block: bool = False) -> None:
+        """queue a chunk, with block=True wait for room instead of dropping (replay)"""
+        with self.cond:
+            while block and len(self.chunks) >= self.maxlen and not self.closed:
+                self.cond.wait()
+            if len(self.chunks) >= self.maxlen:
+                _, old = self.chunks.popleft()
+                self.dropped += 1
+                self.dropped_bytes += len(old)
+            self.chunks.append((rx_time, chunk))
+            self.pushed += 1
+            if len(self.chunks) > self.high_water:
+                self.high_water = len(self.chunks)
+            self.cond.notify()
+
+    def pop_all(self, timeout: float) -> List[Tuple[float, bytes]]:
+        """every queued chunk, waiting up to timeout for the first one"""
+        with self.cond:
+            if not self.chunks and not self.closed:
+                self.cond.wait(timeout)
+            out = list(self.chunks)
+            self.chunks.clear()
+            self.cond.notify_all()  # wake a blocked push
+            return out
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def signals(self, prefix: str = "bridge/rx_queue/") -> Dict[str, Any]:
+        """depth, high water mark (reset on read) and drop counters"""
+        with self.cond:
+            high_water, self.high_water = self.high_water, len(self.chunks)
+            return {
+                prefix + "depth": len(self.chunks),
+                prefix + "high_water": high_water,
+                prefix + "chunks": self.pushed,
+                prefix + "drops": self.dropped,
+                prefix + "dropped_bytes": self.dropped_bytes,
+            }
+
+
+class StageTimer(object):
+    """time spent per pass of one stage, mean and max over the last reporting window"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.passes = 0
+        self.busy = 0.0  # total seconds over all windows
+
+    def add(self, seconds: float) -> None:
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.busy += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def time(self) -> "_StageTiming":
+        """context manager timing one pass"""
+        return _StageTiming(self)
+
+    def signals(self, prefix: str = "bridge/") -> Dict[str, Any]:
+        """bridge/{stage}/time_ms_avg, time_ms_max and passes, starts a new window"""
+        with self.lock:
+            count, total, peak = self.count, self.total, self.max
+            self.passes += count
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+        key = f"{prefix}{self.name}/"
+        return {
+            key + "time_ms_avg": (total / count) * 1000.0 if count else 0.0,
+            key + "time_ms_max": peak * 1000.0,
+            key + "passes": self.passes,
+        }
+
+
+class _StageTiming(object):
+    __slots__ = ("timer", "start")
+
+    def __init__(self, timer: StageTimer) -> None:
+        self.timer = timer
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.timer.add(time.perf_counter() - self.start)
+
+
+class LatencyHistogram(object):
+    """
+    fixed log spaced buckets (BUCKETS_PER_OCTAVE per doubling, from min_s
+    up), so add() is one log2 and one increment and percentiles are exact
+    to about 19%. signals() reports the last window, dump() everything.
+    """
+
+    BUCKETS_PER_OCTAVE = 4
+
+    def __init__(self, name: str, min_s: float = 1e-6, octaves: int = 30) -> None:
+        self.name = name
+        self.min_s = min_s
+        self.nbuckets = octaves * self.BUCKETS_PER_OCTAVE + 1
+        self.lock = threading.Lock()
+        self.counts = [0] * self.nbuckets
+        self.max = 0.0
+        self.total_counts = [0] * self.nbuckets
+        self.total_max = 0.0
+
+    def add(self, seconds: float, n: int = 1) -> None:
+        """n frames that each took seconds"""
+        if seconds <= self.min_s:
+            i = 0
+        else:
+            i = min(int(math.log2(seconds / self.min_s) * self.BUCKETS_PER_OCTAVE) + 1, self.nbuckets - 1)
+        with self.lock:
+            self.counts[i] += n
+            if seconds > self.max:
+                self.max = seconds
+
+    def _upper(self, i: int) -> float:
+        return self.min_s * 2.0 ** (i / self.BUCKETS_PER_OCTAVE)
+
+    def _percentiles(self, counts: List[int], peak: float, ps: Tuple[float, ...]) -> List[float]:
+        total = sum(counts)
+        out = []
+        for p in ps:
+            if not total:
+                out.append(0.0)
+                continue
+            rank = p / 100.0 * total
+            seen = 0
+            for i, c in enumerate(counts):
+                seen += c
+                if seen >= rank and c:
+                    # upper bucket edge, never above the largest value seen
+                    out.append(min(self._upper(i), peak))
+                    break
+        return out
+
+    def signals(self, prefix: str = "bridge/latency/") -> Dict[str, Any]:
+        """p50, p95, p99 and max in ms over the window since the last call"""
+        with self.lock:
+            counts, self.counts = self.counts, [0] * self.nbuckets
+            peak, self.max = self.max, 0.0
+            for i, c in enumerate(counts):
+                self.total_counts[i] += c
+            if peak > self.total_max:
+                self.total_max = peak
+        p50, p95, p99 = self._percentiles(counts, peak, (50, 95, 99))
+        key = f"{prefix}{self.name}/"
+        return {
+            key + "p50_ms": p50 * 1000.0,
+            key + "p95_ms": p95 * 1000.0,
+            key + "p99_ms": p99 * 1000.0,
+            key + "max_ms": peak * 1000.0,
+            key + "frames": sum(counts),
+        }
+
+    def dump(self) -> str:
+        """one line summary over the whole run"""
+        with self.lock:
+            counts = [a + b for a, b in zip(self.total_counts, self.counts)]
+            peak = max(self.total_max, self.max)
+        p50, p95, p99 = self._percentiles(counts, peak, (50, 95, 99))
+        return (f"{self.name:<8} {sum(counts):>9} frames  p50 {p50 * 1000:8.3f}  p95 {p95 * 1000:8.3f}  "
+                f"p99 {p99 * 1000:8.3f}  max {peak * 1000:8.3f} ms")
@@ -0,0 +1,107 @@
+"""
+Full-fidelity sample streaming for the telemetry bridge.
+
+Instead of the last value of every signal, SampleBuffer keeps every decoded
+sample since the last flush together with its own timestamp, and
+pack_sample_batches() turns them into columnar msgpack batches (per signal
+one array of timestamps and one array of values) split over as many
+datagrams as needed to stay under the UDP size limit.
+
+Datagram layout (msgpack map):
+    {"timestamp": publish time, "batch": batch counter, "part": i, "parts": n,
+     "series": {signal name: [[t0, t1, ...], [v0, v1, ...]], ...}}
+
+Usage example (consumer side):
+    series = unpack_sample_batch(sock.recv(65535))["series"]
+    for name, (timestamps, values) in series.items():
+        ...
+"""
+
+from typing import Any, Dict, List, Set, Tuple
+
+import msgpack
+
+# stays below a 1500 byte Ethernet MTU after IP/UDP headers
+MAX_DATAGRAM = 1400
+
+Series = Tuple[List[float], List[Any]]
+
+
+class SampleBuffer(object):
+    """every (timestamp, value) of every signal since the last take()"""
+
+    def __init__(self) -> None:
+        self.series: Dict[str, Series] = {}
+        self.samples = 0
+
+    def add(self, timestamp: float, updates: Dict[str, Any]) -> None:
+        """record one sample per signal in updates, all taken at timestamp"""
+        series = self.series
+        for name, value in updates.items():
+            s = series.get(name)
+            if s is None:
+                series[name] = s = ([], [])
+            s[0].append(timestamp)
+            s[1].append(value)
+        self.samples += len(updates)
+
+    def take(self) -> Dict[str, Series]:
+        """hand over everything collected so far and start empty"""
+        series, self.series = self.series, {}
+        self.samples = 0
+        return series
+
+
+def _pack_entries(name: str, timestamps: List[float], values: List[Any], limit: int) -> List[bytes]:
+    """packed key + [timestamps, values] map entries of one signal, split until each fits limit"""
+    entry = msgpack.packb(name) + msgpack.packb([timestamps, values])
+    if len(entry) <= limit or len(timestamps) < 2:
+        return [entry]
+    half = len(timestamps) // 2
+    return (_pack_entries(name, timestamps[:half], values[:half], limit)
+            + _pack_entries(name, timestamps[half:], values[half:], limit))
+
+
+def _map_header(n: int) -> bytes:
+    if n < 16:
+        return bytes([0x80 | n])
+    return b"\xde" + n.to_bytes(2, "big")
+
+
+def pack_sample_batches(series: Dict[str, Series], timestamp: float, batch: int = 0,
+                        max_datagram: int = MAX_DATAGRAM) -> List[bytes]:
+    """
+    encode collected series into datagrams of at most max_datagram bytes
+
+    Every signal is packed once. Signals with more samples than fit in one
+    datagram are split into consecutive time ranges, which then show up in
+    several parts of the same batch.
+    """
+    # room left for the envelope, generous for the 2 byte map header and the part counters
+    limit = max_datagram - 64
+    groups: List[List[bytes]] = []
+    names: Set[str] = set()
+    size = limit + 1
+    for name, (timestamps, values) in series.items():
+        for entry in _pack_entries(name, timestamps, values, limit):
+            # a signal split over parts must not repeat its key inside one map
+            if size + len(entry) > limit or name in names or len(groups[-1]) >= 0xFFFF:
+                groups.append([])
+                names = set()
+                size = 0
+            groups[-1].append(entry)
+            names.add(name)
+            size += len(entry)
+
+    packets = []
+    for part, group in enumerate(groups):
+        head = msgpack.packb({"timestamp": timestamp, "batch": batch, "part": part, "parts": len(groups)})
+        # reopen the envelope map to append the pre-packed series without packing it again
+        head = _map_header(5) + head[1:]
+        packets.append(head + msgpack.packb("series") + _map_header(len(group)) + b"".join(group))
+    return packets
+
+
+def unpack_sample_batch(packet: bytes) -> Dict[str, Any]:
+    """decode one datagram of pack_sample_batches()"""
+    return msgpack.unpackb(packet, strict_map_key=False)
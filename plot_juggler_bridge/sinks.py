@@ -0,0 +1,134 @@
+"""
+Output sinks for the telemetry bridge.
+
+The bridge owns the serial port, so every consumer (PlotJuggler, a recorder,
+the MATLAB base station) is fed from one decode pass. Each packet is encoded
+once and handed to every sink as the same bytes; sinks never block the
+publisher and keep their own send, drop and error counters.
+
+Destinations are given as URLs:
+    udp://127.0.0.1:9870          unicast UDP
+    multicast://239.192.0.1:9870  multicast UDP (optional ?ttl=N&iface=A.B.C.D)
+    unix:///tmp/telemetry.sock    Unix datagram socket (not on Windows)
+
+Usage example:
+    sinks = SinkSet.from_urls(["udp://127.0.0.1:9870", "unix:///tmp/rec.sock"])
+    sinks.send(packet)
+    signals.update(sinks.signals())
+"""
+
+import socket
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+class Sink(object):
+    """one destination, send() never raises and never blocks"""
+
+    def __init__(self, name: str, sock: socket.socket, address: Any) -> None:
+        self.name = name
+        self.sock = sock
+        self.address = address
+        sock.setblocking(False)
+        self.sent = 0
+        self.sent_bytes = 0
+        self.drops = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def send(self, packet: bytes) -> bool:
+        try:
+            self.sock.sendto(packet, self.address)
+        except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+            # socket buffer full or nobody listening yet, the stream goes on
+            self.drops += 1
+            return False
+        except OSError as e:
+            self.errors += 1
+            if str(e) != self.last_error:
+                self.last_error = str(e)
+                print(f"[warn] sink {self.name}: {e}")
+            return False
+        self.sent += 1
+        self.sent_bytes += len(packet)
+        return True
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name})"
+
+
+class UdpSink(Sink):
+    def __init__(self, host: str, port: int) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        super().__init__(f"udp_{host}_{port}", sock, (host, port))
+
+
+class MulticastSink(Sink):
+    def __init__(self, group: str, port: int, ttl: int = 1, interface: Optional[str] = None) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        if interface:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        super().__init__(f"mcast_{group}_{port}", sock, (group, port))
+
+
+class UnixDatagramSink(Sink):
+    def __init__(self, path: str) -> None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix datagram sinks are not supported on this platform")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        super().__init__("unix_" + path.strip("/").replace("/", "_"), sock, path)
+
+
+def make_sink(url: str) -> Sink:
+    """build a sink from a udp://, multicast:// or unix:// URL"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme == "unix":
+        return UnixDatagramSink(parts.netloc + parts.path)
+    if scheme in ("udp", "multicast"):
+        if not parts.hostname or parts.port is None:
+            raise ValueError(f"sink {url!r} needs host:port")
+        if scheme == "udp":
+            return UdpSink(parts.hostname, parts.port)
+        query = parse_qs(parts.query)
+        ttl = int(query.get("ttl", ["1"])[0])
+        interface = query.get("iface", [None])[0]
+        return MulticastSink(parts.hostname, parts.port, ttl, interface)
+    raise ValueError(f"unknown sink type in {url!r}, use udp://, multicast:// or unix://")
+
+
+class SinkSet(object):
+    """fans every packet out to all sinks"""
+
+    def __init__(self, sinks: Iterable[Sink]) -> None:
+        self.sinks: List[Sink] = list(sinks)
+
+    @classmethod
+    def from_urls(cls, urls: Iterable[str]) -> "SinkSet":
+        return cls(make_sink(url) for url in urls)
+
+    def send(self, packet: bytes) -> int:
+        """number of sinks that accepted the packet"""
+        ok = 0
+        for sink in self.sinks:
+            ok += sink.send(packet)
+        return ok
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+    def signals(self, prefix: str = "bridge/sink/") -> Dict[str, Any]:
+        """per sink packets, bytes, drops and errors"""
+        out = {}
+        for sink in self.sinks:
+            key = f"{prefix}{sink.name}/"
+            out[key + "packets"] = sink.sent
+            out[key + "bytes"] = sink.sent_bytes
+            out[key + "drops"] = sink.drops
+            out[key + "errors"] = sink.errors
+        return out
@@ -0,0 +1,97 @@
+"""
+Signal subscription for the telemetry bridge, decode only what is plotted.
+
+A subscription is a list of patterns over "{frame}/{signal}" names:
+    MOTOR/*                   glob (fnmatch, case sensitive)
+    re:ACTUATOR_.*/CURRENT    regular expression, must match the whole name
+    ODRIVE_SET_INPUT_VEL/Input_Vel   plain names match exactly
+
+or the curves of a PlotJuggler layout, so the bridge decodes exactly what
+the layout plots. Curve names carry the parser prefix ("/fields/MOTOR/rpm"),
+only the last two path components are kept, curves that are not CAN
+signals (bridge/..., link/...) simply match nothing.
+
+CanDecodePlan takes the subscription as its signal_filter, frames without a
+subscribed signal are then not decoded at all.
+
+Usage example:
+    sub = Subscription(["MOTOR/*", "re:ACTUATOR_.*/CURRENT"])
+    sub.add_layout("PlotJugglrer.xml")
+    plan = CanDecodePlan(dbc, signal_filter=sub)
+
+    python subscription.py --dbc can_messages_mini_celka.dbc --layout PlotJugglrer.xml
+"""
+
+import argparse
+import fnmatch
+import re
+import xml.etree.ElementTree as ET
+from typing import Iterable, List, Optional, Pattern, Set
+
+REGEX_PREFIX = "re:"
+
+
+def layout_signals(path: str) -> List[str]:
+    """"{frame}/{signal}" names of every curve in a PlotJuggler layout, in layout order"""
+    names: List[str] = []
+    for curve in ET.parse(path).getroot().iter("curve"):
+        parts = [p for p in curve.get("name", "").split("/") if p]
+        if len(parts) >= 2:
+            name = "/".join(parts[-2:])
+            if name not in names:
+                names.append(name)
+    return names
+
+
+class Subscription(object):
+    """predicate over "{frame}/{signal}" names built from names, globs and regular expressions"""
+
+    def __init__(self, patterns: Optional[Iterable[str]] = None) -> None:
+        self.names: Set[str] = set()
+        self.patterns: List[Pattern[str]] = []
+        for pattern in patterns or ():
+            self.add(pattern)
+
+    def add(self, pattern: str) -> None:
+        if pattern.startswith(REGEX_PREFIX):
+            self.patterns.append(re.compile(pattern[len(REGEX_PREFIX):]))
+        elif any(c in pattern for c in "*?["):
+            self.patterns.append(re.compile(fnmatch.translate(pattern)))
+        else:
+            self.names.add(pattern)
+
+    def add_layout(self, path: str) -> int:
+        """subscribe every curve of a PlotJuggler layout, returns the number of curves"""
+        names = layout_signals(path)
+        self.names.update(names)
+        return len(names)
+
+    def __call__(self, name: str) -> bool:
+        return name in self.names or any(p.fullmatch(name) for p in self.patterns)
+
+    def __bool__(self) -> bool:
+        return bool(self.names or self.patterns)
+
+
+if __name__ == "__main__":
+    import cantools
+
+    from can_decoder import CanDecodePlan
+
+    parser = argparse.ArgumentParser(description="Show which DBC signals a subscription decodes")
+    parser.add_argument("--dbc", required=True, help="Path to .dbc file")
+    parser.add_argument("--layout", help="PlotJuggler layout (.xml) to subscribe")
+    parser.add_argument("patterns", nargs="*", help="Signal patterns, FRAME/signal globs or re:<regex>")
+    args = parser.parse_args()
+
+    sub = Subscription(args.patterns)
+    if args.layout:
+        print(f"[subscribe] {sub.add_layout(args.layout)} curves in {args.layout}")
+    plan = CanDecodePlan(cantools.database.load_file(args.dbc), signal_filter=sub)
+    for can_msg in plan.dbc.messages:
+        keys = plan.frames[can_msg.frame_id].keys
+        if keys:
+            print(f"  {can_msg.name}: {', '.join(keys)}")
+    selected, total = plan.signal_count()
+    skipped = plan.skipped_frames()
+    print(f"[subscribe] {selected}/{total} signals decoded, {len(skipped)}/{len(plan.dbc.messages)} frames skipped")
@@ -1,232 +1,406 @@
 #!/usr/bin/env python3
 """
 Telemetry bridge: UART → MAVLink (custom dialect) → CAN decode → MsgPack UDP
+
+The bridge runs as three stages so a slow decode never delays the serial
+port and a blocking read never delays the UDP publish:
+  reader    - thread draining the serial port into a bounded ring of raw chunks
+  decoder   - thread parsing MAVLink, decoding CAN and updating latest_signals
+  publisher - timer driven main loop, heartbeat TX, diagnostics and send to SINKS
+Queue depth, drops and per stage timing are published as bridge/* signals,
+per frame latency histograms (chunk read → frame complete → CAN decoded →
+UDP sent) as bridge/latency/{frame,decode,send,total}/* and dumped on exit.
+
+PUBLISH_MODE "latest" sends the last value of every signal each SEND_PERIOD,
+"samples" keeps every decoded sample with its source time (the MCU timestamp
+mapped to host time by clock_sync.py, else the receive time) and sends columnar
+batches split to UDP_MAX_DATAGRAM (see sample_batch.py), "compact" sends
+integer ids and changed values only (see compact_codec.py).
+
+SUBSCRIBE / SUBSCRIBE_LAYOUT restrict the CAN decode to the listed signals or
+to the curves of a PlotJuggler layout (see subscription.py), frames without a
+subscribed signal are counted but never decoded.
 """
 
+import glob
 import serial
-import socket
 import msgpack
+import threading
 import time
 import mavmc_dialect as mavlink
 from pymavlink import mavutil
 import cantools
 import psutil  # add near the top with other imports
+from can_decoder import CanDecodePlan
+from pipeline import ChunkRing, LatencyHistogram, StageTimer
+from sample_batch import SampleBuffer, pack_sample_batches
+from compact_codec import CompactEncoder
+from sinks import SinkSet
+from capture import CaptureWriter, ReplaySerial
+from clock_sync import ClockSync
+from tx_scheduler import PRIO_HEARTBEAT, TxScheduler
+from subscription import Subscription
 
 
 # === CONFIG ===
 SERIAL_PORT = "COM17"
 BAUDRATE = 115200
-UDP_ADDR = ("127.0.0.1", 9870)
+# every packet is encoded once and sent to all of these: udp://, multicast:// or unix://
+SINKS = [
+    "udp://127.0.0.1:9870",                # PlotJuggler
+    # "multicast://239.192.0.1:9870",      # base station / recorder on the LAN
+    # "unix:///tmp/telemetry.sock",        # local consumer
+]
 SEND_PERIOD = 0.1
 DBC_PATH = r"D:\Dane\workspace\can-messages-mini-celka\can_messages_mini_celka.dbc"
+RX_QUEUE_LEN = 256                 # raw serial chunks buffered between reader and decoder
+PUBLISH_MODE = "latest"            # "latest": last value per SEND_PERIOD, "samples": every sample, columnar batches
+                                   # "compact": interned ids, changed values only (compact_codec.py)
+UDP_MAX_DATAGRAM = 1400            # "samples" and "compact" modes split packets to stay under this size
+SCHEMA_PERIOD = 2.0                # "compact" mode re-sends the name schema and all values this often
+CAPTURE_DIR = None                 # e.g. r"captures", records every raw serial chunk (capture.py)
+CAPTURE_MAX_BYTES = 256 * 1024 * 1024  # rotate capture files at this size
+REPLAY_FILES = None                # e.g. r"captures/session_*.mmcap", read these captures instead of SERIAL_PORT
+REPLAY_SPEED = 1.0                 # 1.0 recorded timing, N for N times faster, 0 as fast as possible
+CLOCK_SYNC = True                  # map GENERIC_CAN_FRAME.timestamp to host time (clock_sync.py)
+CLOCK_TICK_HZ = 1000.0             # MCU timestamp ticks per second
+AIR_SPEED = 64                     # SiK AIR_SPEED (kbit/s), the uplink is rate limited to its share of it
+TXBUF_SLOW = 50                    # RADIO_STATUS.txbuf (% free) below which bulk uplink waits
+TXBUF_STOP = 20                    # ... below which only heartbeats are sent
+SUBSCRIBE = None                   # e.g. ["MOTOR/*", "re:ACTUATOR_.*/CURRENT"], decode only these CAN signals
+SUBSCRIBE_LAYOUT = None            # e.g. r"PlotJugglrer.xml", decode only the signals the layout plots
 # ==============
 
 dbc = cantools.database.load_file(DBC_PATH)
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-ser = serial.Serial(SERIAL_PORT, BAUDRATE, timeout=0.01)
+subscription = Subscription(SUBSCRIBE)
+if SUBSCRIBE_LAYOUT:
+    subscription.add_layout(SUBSCRIBE_LAYOUT)
+# per frame ID decode plan, built once, unsubscribed frames are never decoded
+can_plan = CanDecodePlan(dbc, signal_filter=subscription if SUBSCRIBE or SUBSCRIBE_LAYOUT else None)
+unknown_can_ids = set()
+sinks = SinkSet.from_urls(SINKS)
+if REPLAY_FILES:
+    ser = ReplaySerial(sorted(glob.glob(REPLAY_FILES)), REPLAY_SPEED, timeout=0.01)
+else:
+    # plain port names and pyserial URLs (e.g. "socket://127.0.0.1:5760" from traffic_gen.py)
+    ser = serial.serial_for_url(SERIAL_PORT, BAUDRATE, timeout=0.01)
+# URL handlers like socket:// only report whether data is waiting (0 or 1), not how much
+exact_in_waiting = isinstance(ser, (serial.Serial, ReplaySerial))
 
 # Create MAVLink parser for incoming messages
 parser = mavlink.MAVLink(None)     # use your dialect directly
 parser.srcSystem = 1
 parser.srcComponent = 1
+parser.fast_resync = True          # resync on the next marker after noise, no exceptions
+# Only decode what the bridge consumes, DEBUG_FRAME is CRC checked and counted
+parser.set_subscription({
+    mavlink.MAVLINK_MSG_ID_GENERIC_CAN_FRAME,
+    mavlink.MAVLINK_MSG_ID_RADIO_STATUS,
+    mavlink.MAVLINK_MSG_ID_HEARTBEAT,
+})
 
 # Create MAVLink serializer for outgoing messages
 sender = mavlink.MAVLink(ser)  # use serial as its output stream
 sender.srcSystem = 255         # GCS system ID
 sender.srcComponent = 190      # GCS component ID
-
+# All uplink goes through the scheduler: priorities, air rate limit, back-off on a full radio buffer
+tx = TxScheduler(sender, AIR_SPEED, BAUDRATE, txbuf_slow=TXBUF_SLOW, txbuf_stop=TXBUF_STOP)
+
+# --- Stage plumbing ---
+rx_ring = ChunkRing(RX_QUEUE_LEN)
+decode_timer = StageTimer("decode")
+publish_timer = StageTimer("publish")
+# Per frame latency between the read of its chunk and the UDP send, all on time.monotonic()
+frame_latency = LatencyHistogram("frame")     # chunk read -> MAVLink frame complete
+decode_latency = LatencyHistogram("decode")   # frame complete -> CAN decoded
+send_latency = LatencyHistogram("send")       # CAN decoded -> UDP sent
+total_latency = LatencyHistogram("total")     # chunk read -> UDP sent
+latency_histograms = (frame_latency, decode_latency, send_latency, total_latency)
+wall_offset = time.time() - time.monotonic()  # monotonic read time -> sample timestamp
+clock = ClockSync(CLOCK_TICK_HZ)   # MCU tick -> monotonic host time, fed by the decoder
+stop_event = threading.Event()
+
+# Raw UART capture, written by a background thread
+capture = CaptureWriter(CAPTURE_DIR, "session", BAUDRATE, CAPTURE_MAX_BYTES) if CAPTURE_DIR else None
+
+# Written by the decoder, swapped out by the publisher under the lock
 latest_signals = {}
-last_send = time.time()
+pending_frames = []                # (read time, decoded time, frames) not published yet
+sample_buffer = SampleBuffer()     # PUBLISH_MODE == "samples"
+signals_lock = threading.Lock()
+sample_batches = 0
+compact_encoder = CompactEncoder(SCHEMA_PERIOD, UDP_MAX_DATAGRAM)  # PUBLISH_MODE == "compact"
 
 heartbeat_period = 1.0
-last_heartbeat = time.time()
 last_rx = time.time()
-link_alive = True
 
+# Diagnostic counters only ever grow and each has a single writer thread
+# (rx_bytes the reader, can_* the decoder, tx_bytes the publisher), the
+# publisher turns them into rates from snapshots and never resets them
 rx_bytes = 0
 tx_bytes = 0
-last_uart_sample = time.time()
-uart_rx_speed = 0.0
-uart_tx_speed = 0.0
 
 last_remote_heartbeat = 0.0
 
 # --- CAN and MAV diagnostic counters ---
 can_frames = 0
 can_decode_errors = 0
-last_diag_sample = time.time()
-can_fps = 0.0
-loop_time = 0.0
-can_errors_last = 0
-cpu_usage = 0.0
-
 mav_crc_errors = 0
 last_mav_error_print = 0.0
 
-print(f"[bridge] Serial port : {SERIAL_PORT} @ {BAUDRATE} baud")
-print(f"[bridge] UDP target  : {UDP_ADDR[0]}:{UDP_ADDR[1]}")
+if REPLAY_FILES:
+    speed = f"{REPLAY_SPEED:g}x" if REPLAY_SPEED > 0 else "max speed"
+    print(f"[bridge] Replay      : {len(ser.paths)} capture file(s) at {speed}, recorded @ {ser.baudrate} baud")
+else:
+    print(f"[bridge] Serial port : {SERIAL_PORT} @ {BAUDRATE} baud")
+print(f"[bridge] Sinks       : {', '.join(SINKS)}")
 print(f"[bridge] DBC loaded  : {dbc.version or 'unknown version'} ({len(dbc.messages)} messages)")
-print("[bridge] Running...")
-
-try:
-    while True:
-        # --- Measure loop time ---
-        t_loop_start = time.time()
-
-        # --- Recieve bytes from serial port ---
-        chunk = ser.read(4096)
+if can_plan.signal_filter is not None:
+    selected, total = can_plan.signal_count()
+    print(f"[bridge] Subscribed  : {selected}/{total} signals, {len(can_plan.skipped_frames())} frames not decoded")
+if capture is not None:
+    print(f"[bridge] Capturing   : {capture.current_file}")
+
+
+# === Reader stage ===
+def reader_loop():
+    """drain the serial port continuously, never waits on the decoder"""
+    global rx_bytes
+    while not stop_event.is_set():
+        try:
+            if exact_in_waiting:
+                # block for the first byte (up to the port timeout), then take everything waiting
+                chunk = ser.read(max(ser.in_waiting, 1))
+            else:
+                # whatever arrives within the port timeout, up to one block
+                chunk = ser.read(4096)
+        except serial.SerialException as e:
+            print(f"[warn] Serial read failed: {e}")
+            time.sleep(0.5)
+            continue
         if chunk:
+            if capture is not None:
+                capture.write(time.monotonic_ns(), chunk)
             # Count bytes for diagnostic purposes
             rx_bytes += len(chunk)
-            for b in chunk:
-                try:
-                    msg = parser.parse_char(bytes([b]))
-                except mavlink.MAVError as e:
-                    # Ignore bad frames, CRC errors, and wrong prefixes
-                    mav_crc_errors += 1
+            # a max speed replay waits for the decoder instead of dropping chunks
+            rx_ring.push(time.monotonic(), chunk, block=bool(REPLAY_FILES) and REPLAY_SPEED <= 0)
+        elif REPLAY_FILES and ser.finished:
+            break
+    rx_ring.close()
+
+
+# === Decoder stage ===
+def handle_message(msg, updates):
+    global last_rx, can_frames, can_decode_errors, last_remote_heartbeat
+    last_rx = time.time()
+
+    if msg.get_msgId() == 200:  # GENERIC_CAN_FRAME
+        frame_id = msg.id
+        try:
+            # one plan lookup and one unpack, keys and float32 signals are precomputed
+            if can_plan.decode_into(frame_id, bytes(msg.data), updates) is not None:
+                can_frames += 1  # count CAN frames seen
+            else:
+                can_decode_errors += 1  # unknown ID, warn only the first time
+                if frame_id not in unknown_can_ids:
+                    unknown_can_ids.add(frame_id)
+                    print(f"[warn] CAN ID {frame_id:#04x} not in DBC")
+
+        except Exception as e:
+            can_decode_errors += 1
+            print(f"[warn] CAN decode failed for ID {frame_id:#04x}: {e}")
+
+    elif msg.get_msgId() == 109: # RADIO_STATUS
+        # Convert raw telemetry to dBm and compute SNRs
+        try:
+            # scale and offset identical to MATLAB
+            rssi      = (msg.rssi     / 1.9) - 127.0
+            remrssi   = (msg.remrssi  / 1.9) - 127.0
+            noise     = (msg.noise    / 1.9) - 127.0
+            remnoise  = (msg.remnoise / 1.9) - 127.0
+
+            txbuf     = float(msg.txbuf)
+            rxerrors  = float(msg.rxerrors)
+            fixed     = float(msg.fixed)
+            tx.update_radio_status(msg.txbuf)  # uplink back-off
+
+            # Compute SNRs
+            snr      = rssi - noise     if not (rssi is None or noise is None) else float('nan')
+            rem_snr  = remrssi - remnoise if not (remrssi is None or remnoise is None) else float('nan')
+
+            # Feed to PlotJuggler-friendly structure
+            updates.update({
+                "link/rssi":      rssi,
+                "link/remrssi":   remrssi,
+                "link/noise":     noise,
+                "link/remnoise":  remnoise,
+                "link/snr":       snr,
+                "link/rem_snr":   rem_snr,
+                "link/txbuf":     txbuf,
+                "link/rxerrors":  rxerrors,
+                "link/fixed":     fixed
+            })
+
+        except Exception as e:
+            # keep bridge alive even if unexpected field missing
+            print(f"[warn] RADIO_STATUS decode failed: {e}")
+            pass
+
+    elif msg.get_msgId() == 0:  # HEARTBEAT from remote
+        last_remote_heartbeat = time.time()
+        # You can record heartbeat info too if you like
+        # updates.update({
+        #     "remote_heartbeat/type": msg.type,
+        #     "remote_heartbeat/autopilot": msg.autopilot,
+        #     "remote_heartbeat/system_status": msg.system_status,
+        #     "remote_heartbeat/base_mode": msg.base_mode,
+        # })
+
+    elif msg.get_msgId() == 201: # DEBUG_FRAME
+        pass
+
+
+def decoder_loop():
+    global mav_crc_errors, last_mav_error_print
+    while not (stop_event.is_set() and rx_ring.closed):
+        chunks = rx_ring.pop_all(timeout=SEND_PERIOD)
+        if not chunks:
+            if rx_ring.closed:
+                break
+            continue
+
+        with decode_timer.time():
+            updates = {}
+            samples = []  # (rx_time, updates of one message) in "samples" mode
+            decoded = []  # (read time, decoded time, frames) for the latency histograms
+            for rx_time, chunk in chunks:
+                # Parse the whole chunk at once, bad frames, CRC errors and wrong
+                # prefixes are counted by the parser instead of raising
+                errors_before = parser.total_receive_errors
+                msgs = parser.parse_chunk(chunk)
+                t_frame = time.monotonic()
+                new_errors = parser.total_receive_errors - errors_before
+                if new_errors:
+                    mav_crc_errors += new_errors
 
                     # Print occasional warning for visibility (every 100 errors or every 5 seconds)
                     now_err = time.time()
-                    if (mav_crc_errors % 100 == 0) or (now_err - last_mav_error_print > 5.0):
-                        print(f"[warn] MAVLink parser error ({mav_crc_errors} total): {e}")
+                    if (mav_crc_errors // 100 != (mav_crc_errors - new_errors) // 100) or (now_err - last_mav_error_print > 5.0):
+                        print(f"[warn] MAVLink parser errors ({mav_crc_errors} total): {parser.error_counts}")
                         last_mav_error_print = now_err
 
-                if msg is None:
+                keep_samples = PUBLISH_MODE == "samples"
+                for msg in msgs:
+                    msg_updates = {} if keep_samples else updates
+                    handle_message(msg, msg_updates)
+                    source_time = rx_time
+                    if CLOCK_SYNC and msg.get_msgId() == 200:
+                        # when the MCU captured the frame, not when the radio delivered it
+                        source_time = clock.update(msg.timestamp, rx_time)
+                    if keep_samples and msg_updates:
+                        samples.append((source_time + wall_offset, msg_updates))
+
+                if msgs:
+                    t_decoded = time.monotonic()
+                    frame_latency.add(t_frame - rx_time, len(msgs))
+                    decode_latency.add(t_decoded - t_frame, len(msgs))
+                    decoded.append((rx_time, t_decoded, len(msgs)))
+
+            with signals_lock:
+                latest_signals.update(updates)
+                pending_frames.extend(decoded)
+                for sample_time, msg_updates in samples:
+                    sample_buffer.add(sample_time, msg_updates)
+
+
+# === Publisher stage ===
+def publisher_loop():
+    global tx_bytes, latest_signals, sample_batches
+    global pending_frames
+
+    last_heartbeat = 0.0
+    last_diag_sample = time.time()
+    last_uart_sample = time.time()
+    last_can_frames = last_can_errors = 0
+    last_rx_bytes = last_tx_bytes = 0
+    can_fps = 0.0
+    can_errors_last = 0
+    cpu_usage = 0.0
+    uart_rx_speed = 0.0
+    uart_tx_speed = 0.0
+    stage_signals = {}
+    next_send = time.time()
+
+    while not stop_event.is_set():
+        # Timer driven: wake up on the send schedule, not on serial traffic
+        next_send += SEND_PERIOD
+        delay = next_send - time.time()
+        if delay > 0:
+            stop_event.wait(delay)
+        else:
+            next_send = time.time()  # fell behind, do not burst to catch up
+
+        with publish_timer.time():
+            now = time.time()
+
+            # --- Heartbeat send ---
+            if now - last_heartbeat >= heartbeat_period:
+                hb = sender.heartbeat_encode(
+                    type=6,
+                    autopilot=8,
+                    base_mode=0,
+                    custom_mode=0,
+                    system_status=0
+                )
+                tx.submit(hb, PRIO_HEARTBEAT)
+                last_heartbeat = now
+            # Send whatever the rate limit and the radio buffer allow, in one write
+            tx_bytes += tx.pump()  # count bytes sent
+
+            # --- Diagnostics: compute FPS, CPU, stage stats ---
+            dt_diag = now - last_diag_sample
+            if dt_diag >= 1.0:
+                frames_now, errors_now = can_frames, can_decode_errors
+                can_fps = (frames_now - last_can_frames) / dt_diag
+                can_errors_last = errors_now - last_can_errors  # surowy licznik z ostatniej sekundy
+                last_can_frames, last_can_errors = frames_now, errors_now
+
+                cpu_usage = psutil.cpu_percent(interval=None)
+                stage_signals = {}
+                stage_signals.update(decode_timer.signals())
+                stage_signals.update(publish_timer.signals())
+                for histogram in latency_histograms:
+                    stage_signals.update(histogram.signals())
+                if CLOCK_SYNC:
+                    stage_signals.update(clock.signals())
+                stage_signals.update(tx.signals())
+                last_diag_sample = now
+
+            # --- Link & UART telemetry + UDP send ---
+            link_alive = (now - last_remote_heartbeat) < 2.0
+
+            # update UART throughput once per SEND_PERIOD
+            dt_uart = now - last_uart_sample
+            if dt_uart > 0:
+                rx_now = rx_bytes
+                uart_rx_speed = (rx_now - last_rx_bytes) / dt_uart
+                uart_tx_speed = (tx_bytes - last_tx_bytes) / dt_uart
+                last_rx_bytes, last_tx_bytes = rx_now, tx_bytes
+                last_uart_sample = now
+
+            uart_util_rx = (uart_rx_speed * 10 / ser.baudrate) * 100.0
+            uart_util_tx = (uart_tx_speed * 10 / ser.baudrate) * 100.0
+
+            # --- Send ---
+            with signals_lock:
+                if not (latest_signals or sample_buffer.samples > 0):
+                    # nothing to send, pending frames wait for the packet that carries them out
                     continue
-                last_rx = time.time()
-
-                if msg.get_msgId() == 200:  # GENERIC_CAN_FRAME
-                    frame_id = msg.id
-                    payload = bytes(msg.data)
-                    try:
-                        can_msg = dbc.get_message_by_frame_id(frame_id)
-                        decoded = can_msg.decode(payload)
-                        frame_name = can_msg.name
-                        can_frames += 1  # count CAN frames seen
-
-                        # --- handle FLOAT32_IEEE conversions ---
-                        import struct
-                        for signal in can_msg.signals:
-                            unit = signal.unit or ""
-                            if "FLOAT32_IEEE" in unit and signal.name in decoded:
-                                raw_val = decoded[signal.name]
-                                if isinstance(raw_val, int):
-                                    try:
-                                        decoded[signal.name] = struct.unpack('<f', raw_val.to_bytes(4, 'little'))[0]
-                                    except Exception:
-                                        pass  # ignore malformed float
-
-                        # --- store decoded signals with frame prefix ---
-                        for sig_name, sig_value in decoded.items():
-                            full_name = f"{frame_name}/{sig_name}"
-                            latest_signals[full_name] = sig_value
-
-                    except Exception as e:
-                        can_decode_errors += 1
-                        print(f"[warn] CAN decode failed for ID {frame_id:#04x}: {e}")
-
-                elif msg.get_msgId() == 109: # RADIO_STATUS
-                    # Convert raw telemetry to dBm and compute SNRs
-                    try:
-                        # scale and offset identical to MATLAB
-                        rssi      = (msg.rssi     / 1.9) - 127.0
-                        remrssi   = (msg.remrssi  / 1.9) - 127.0
-                        noise     = (msg.noise    / 1.9) - 127.0
-                        remnoise  = (msg.remnoise / 1.9) - 127.0
-
-                        txbuf     = float(msg.txbuf)
-                        rxerrors  = float(msg.rxerrors)
-                        fixed     = float(msg.fixed)
-
-                        # Compute SNRs
-                        snr      = rssi - noise     if not (rssi is None or noise is None) else float('nan')
-                        rem_snr  = remrssi - remnoise if not (remrssi is None or remnoise is None) else float('nan')
-
-                        # Feed to PlotJuggler-friendly structure
-                        latest_signals.update({
-                            "link/rssi":      rssi,
-                            "link/remrssi":   remrssi,
-                            "link/noise":     noise,
-                            "link/remnoise":  remnoise,
-                            "link/snr":       snr,
-                            "link/rem_snr":   rem_snr,
-                            "link/txbuf":     txbuf,
-                            "link/rxerrors":  rxerrors,
-                            "link/fixed":     fixed
-                        })
-
-                    except Exception as e:
-                        # keep bridge alive even if unexpected field missing
-                        print(f"[warn] RADIO_STATUS decode failed: {e}")
-                        pass
-
-                elif msg.get_msgId() == 0:  # HEARTBEAT from remote
-                    last_remote_heartbeat = time.time()
-                    try:
-                        pass
-                        # You can record heartbeat info too if you like
-                        # latest_signals.update({
-                        #     "remote_heartbeat/type": msg.type,
-                        #     "remote_heartbeat/autopilot": msg.autopilot,
-                        #     "remote_heartbeat/system_status": msg.system_status,
-                        #     "remote_heartbeat/base_mode": msg.base_mode,
-                        # })
-                    except Exception:
-                        pass
-
-                elif msg.get_msgId() == 201: # DEBUG_FRAME
-                    pass
-
-        # --- Heartbeat send ---
-        now = t_loop_start
-        if now - last_heartbeat >= heartbeat_period:
-            hb = sender.heartbeat_encode(
-                type=6,
-                autopilot=8,
-                base_mode=0,
-                custom_mode=0,
-                system_status=0
-            )
-            # Pack manually to capture raw bytes
-            payload = hb.pack(sender)
-            ser.write(payload)          # actually send
-            tx_bytes += len(payload)    # count bytes sent
-            last_heartbeat = now
-
-        # --- Diagnostics: compute FPS, CPU, loop time ---
-        dt_diag = now - last_diag_sample
-        if dt_diag >= 1.0:
-            can_fps = can_frames / dt_diag
-            can_errors_last = can_decode_errors  # surowy licznik z ostatniej sekundy
-
-            # reset liczników
-            can_frames = 0
-            can_decode_errors = 0
-
-            cpu_usage = psutil.cpu_percent(interval=None)
-            last_diag_sample = now
-
-
-        # --- Link & UART telemetry + UDP send ---
-        link_alive = (now - last_remote_heartbeat) < 2.0
-
-        # update UART throughput once per SEND_PERIOD
-        dt_uart = now - last_uart_sample
-        if dt_uart > 0:
-            uart_rx_speed = rx_bytes / dt_uart
-            uart_tx_speed = tx_bytes / dt_uart
-            rx_bytes = 0
-            tx_bytes = 0
-            last_uart_sample = now
-
-        uart_util_rx = (uart_rx_speed * 10 / ser.baudrate) * 100.0
-        uart_util_tx = (uart_tx_speed * 10 / ser.baudrate) * 100.0
-
-        # --- Send --- 
-        if now - last_send >= SEND_PERIOD and latest_signals:
-            loop_time = (time.time() - t_loop_start) * 1000.0  # ms
-
-            latest_signals.update({
+                signals, latest_signals = latest_signals, {}
+                frames, pending_frames = pending_frames, []
+
+            signals.update({
                 "link/alive": 1.0 if link_alive else 0.0,
                 "link/latency": now - last_rx,
 
@@ -240,15 +414,101 @@ try:
                 "can/fps": can_fps,
                 "can/decode_errors_last_sec": can_errors_last,
                 "bridge/cpu_usage": cpu_usage,
-                "bridge/loop_time_ms": loop_time
+                "bridge/loop_time_ms": stage_signals.get("bridge/decode/time_ms_avg", 0.0),
+                "mav/crc_errors": mav_crc_errors,
             })
 
-            packet = msgpack.packb({"timestamp": now, "fields": latest_signals})
-            sock.sendto(packet, UDP_ADDR)
-            latest_signals.clear()
-            last_send = now
+            # Stage plumbing: ring depth and drops, per stage timing
+            signals.update(rx_ring.signals())
+            signals.update(stage_signals)
+            signals.update(sinks.signals())
+            if capture is not None:
+                signals.update(capture.signals())
+
+            # Per (sysid, compid) MAVLink stream statistics from the parser
+            for (sysid, compid), stats in list(parser.stream_stats.items()):
+                prefix = f"mav/{sysid}_{compid}/"
+                signals.update({
+                    prefix + "packets": stats.packets,
+                    prefix + "lost": stats.lost,
+                    prefix + "loss_rate": stats.loss_rate(),
+                    prefix + "duplicates": stats.duplicates,
+                })
+
+            if PUBLISH_MODE == "samples":
+                # diagnostics become one more sample each, taken now
+                with signals_lock:
+                    sample_buffer.add(now, signals)
+                    series = sample_buffer.take()
+                for packet in pack_sample_batches(series, now, sample_batches, UDP_MAX_DATAGRAM):
+                    sinks.send(packet)
+                sample_batches += 1
+            elif PUBLISH_MODE == "compact":
+                for packet in compact_encoder.encode(now, signals):
+                    sinks.send(packet)
+            else:
+                packet = msgpack.packb({"timestamp": now, "fields": signals})
+                sinks.send(packet)
+
+            t_sent = time.monotonic()
+            for t_read, t_decoded, n in frames:
+                send_latency.add(t_sent - t_decoded, n)
+                total_latency.add(t_sent - t_read, n)
+
+
+reader = threading.Thread(target=reader_loop, name="serial-reader", daemon=True)
+decoder = threading.Thread(target=decoder_loop, name="decoder", daemon=True)
+reader.start()
+decoder.start()
+print("[bridge] Running...")
+
+
+
+def replay_report():
+    """sustained rates of a finished replay, the deterministic throughput benchmark"""
+    elapsed = ser.elapsed(replay_done)
+    frames = parser.total_packets_received + parser.total_packets_filtered
+    busy = decode_timer.busy
+    print(f"[replay] {ser.chunks} chunks, {ser.bytes} bytes in {elapsed:.2f} s")
+    if elapsed > 0:
+        print(f"[replay] sustained {frames / elapsed:.0f} MAVLink frames/s, {can_frames / elapsed:.0f} CAN frames/s, "
+              f"{ser.bytes / elapsed / 1e6:.2f} MB/s")
+    if busy > 0:
+        print(f"[replay] decode stage {busy:.2f} s busy, {frames / busy:.0f} frames/s, "
+              f"{ser.bytes / busy / 1e6:.2f} MB/s while decoding")
+    print(f"[replay] {mav_crc_errors} receive errors, {rx_ring.dropped} chunks dropped")
+
+
+def watch_replay():
+    """stop the bridge once the decoder has worked through the whole replay"""
+    global replay_done
+    decoder.join()
+    replay_done = time.perf_counter()
+    stop_event.set()
+
+
+replay_done = None
+
+
+if REPLAY_FILES:
+    threading.Thread(target=watch_replay, name="replay-watch", daemon=True).start()
+
+try:
+    publisher_loop()
+    print("\n[bridge] Replay finished, closing ports.")
 except KeyboardInterrupt:
     print("\n[bridge] Interrupted by user, closing ports.")
-    ser.close()
-    sock.close()
-    print("[bridge] Clean exit.")
+stop_event.set()
+reader.join(timeout=1.0)
+decoder.join(timeout=1.0)
+ser.close()
+sinks.close()
+if capture is not None:
+    capture.close()
+    print(f"[bridge] Capture     : {capture.records} chunks in {', '.join(capture.files)}")
+if REPLAY_FILES:
+    replay_report()
+print("[bridge] Latency per frame over the whole run:")
+for histogram in latency_histograms:
+    print(f"[latency] {histogram.dump()}")
+print("[bridge] Clean exit.")
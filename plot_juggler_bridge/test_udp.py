@@ -9,6 +9,9 @@ Telemetry Bridge: UART → MsgPack over UDP for PlotJuggler
 
 Protocol in PlotJuggler:
 UDP Server → Protocol: 'msgpack' → Port: 9870
+
+For real MAVLink traffic on a fake serial port (load and loss tests of
+telemetry_bridge.py) use traffic_gen.py instead.
 """
 
 import serial
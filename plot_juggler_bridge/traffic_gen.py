@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+MAVLink traffic generator, stand-in for the radio on the serial port.
+
+Where test_udp.py fakes decoded signals, this emits the real byte stream
+the bridge parses: GENERIC_CAN_FRAME messages with payloads encoded from the
+DBC, RADIO_STATUS and HEARTBEAT, framed by mavmc_dialect. The stream can be
+written to a pseudo terminal (Linux/macOS) or a TCP socket that
+telemetry_bridge.py opens like a serial port, or to a capture file for
+REPLAY_FILES.
+
+The byte stream depends only on the seed and the options: frames are
+scheduled on a virtual clock, bit errors and dropouts come from the same
+seeded RNG. Writing is paced to the configured baud rate like a UART, so
+asking for more than the link carries shows up as backlog, not as a faster
+link.
+
+Usage example:
+    python traffic_gen.py --dbc can.dbc --rate 0x10=500 --ber 1e-5 --dropouts 0.2
+    (then SERIAL_PORT = the printed /dev/pts/N in telemetry_bridge.py)
+    python traffic_gen.py --dbc can.dbc --tcp 5760    (SERIAL_PORT = "socket://127.0.0.1:5760")
+    python traffic_gen.py --dbc can.dbc --duration 60 --output load.mmcap
+"""
+
+import argparse
+import heapq
+import math
+import os
+import random
+import select
+import socket
+import struct
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cantools
+
+import mavmc_dialect as mavlink
+from can_decoder import FLOAT32_UNIT_TAG
+
+_float32 = struct.Struct("<f")
+_uint32 = struct.Struct("<I")
+
+
+class DbcPayloads(object):
+    """
+    CAN payloads for every DBC message, each signal follows a slow sine
+    inside its DBC range (or its raw range when the DBC gives none) so the
+    decoded plots are easy to check by eye
+    """
+
+    def __init__(self, dbc, rng: random.Random) -> None:
+        self.rng = rng
+        self.messages = {m.frame_id: m for m in dbc.messages if m.length <= 8}
+        # per signal (frequency Hz, phase)
+        self.waves = {(m.frame_id, s.name): (rng.uniform(0.05, 0.5), rng.uniform(0.0, 2 * math.pi))
+                      for m in self.messages.values() for s in m.signals}
+
+    def _raw(self, frame_id: int, signal, t: float):
+        freq, phase = self.waves[(frame_id, signal.name)]
+        wave = math.sin(2 * math.pi * freq * t + phase)
+        if signal.is_float:
+            return 100.0 * wave
+        if FLOAT32_UNIT_TAG in (signal.unit or "") and signal.length == 32:
+            return _uint32.unpack(_float32.pack(100.0 * wave))[0]
+        if signal.is_signed:
+            lo, hi = -(1 << (signal.length - 1)), (1 << (signal.length - 1)) - 1
+        else:
+            lo, hi = 0, (1 << signal.length) - 1
+        scale = signal.conversion.scale or 1
+        offset = signal.conversion.offset
+        if signal.minimum is not None and signal.maximum is not None and signal.maximum > signal.minimum:
+            # DBC range in physical units, converted back to raw
+            a = (signal.minimum - offset) / scale
+            b = (signal.maximum - offset) / scale
+            lo, hi = max(lo, math.ceil(min(a, b))), min(hi, math.floor(max(a, b)))
+        mid = (lo + hi) / 2
+        return int(round(mid + (hi - mid) * wave))
+
+    def _mux_values(self, msg) -> Dict[str, int]:
+        """a random valid id for every multiplexer signal of msg"""
+        ids: Dict[str, List[int]] = {}
+        for s in msg.signals:
+            if s.multiplexer_signal is not None:
+                ids.setdefault(s.multiplexer_signal, []).extend(s.multiplexer_ids or ())
+        return {name: self.rng.choice(sorted(set(values))) for name, values in ids.items() if values}
+
+    def payload(self, frame_id: int, t: float) -> bytes:
+        msg = self.messages[frame_id]
+        mux = self._mux_values(msg) if msg.is_multiplexed() else {}
+        data = {}
+        for s in msg.signals:
+            if s.name in mux:
+                data[s.name] = mux[s.name]
+            elif s.multiplexer_signal is None or mux.get(s.multiplexer_signal) in (s.multiplexer_ids or ()):
+                data[s.name] = self._raw(frame_id, s, t)
+        try:
+            payload = msg.encode(data, scaling=False, strict=False)
+        except Exception:
+            # multiplexed or otherwise unencodable, still exercise the bridge
+            payload = bytes(self.rng.getrandbits(8) for _ in range(msg.length))
+        return bytes(payload).ljust(8, b"\x00")
+
+
+class TrafficGenerator(object):
+    """
+    deterministic MAVLink byte stream on a virtual clock
+
+    rates maps CAN frame IDs to Hz; ber is the probability of every bit
+    being flipped; dropouts per second (Poisson) each silence the link for
+    dropout_ms, the bytes sent meanwhile are lost.
+    """
+
+    def __init__(self, dbc, rates: Dict[int, float], radio_rate: float = 1.0, heartbeat_rate: float = 1.0,
+                 ber: float = 0.0, dropouts: float = 0.0, dropout_ms: float = 200.0, seed: int = 0) -> None:
+        self.rng = random.Random(seed)
+        self.payloads = DbcPayloads(dbc, self.rng)
+        unknown = set(rates) - set(self.payloads.messages)
+        if unknown:
+            raise ValueError(f"CAN IDs not in the DBC (or longer than 8 bytes): {', '.join(hex(i) for i in unknown)}")
+        self.rates = {fid: hz for fid, hz in rates.items() if hz > 0}
+        self.radio_rate = radio_rate
+        self.heartbeat_rate = heartbeat_rate
+        self.ber = ber
+        self.dropouts = dropouts
+        self.dropout_s = dropout_ms / 1000.0
+
+        self.mav = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        self.frames = 0
+        self.bytes = 0
+        self.bit_errors = 0
+        self.dropped_bytes = 0
+        self._next_error = self._error_gap()
+        self._next_dropout = self._dropout_gap(0.0)
+        self._dropout_end = -1.0
+
+    def frame_bytes_per_second(self) -> float:
+        """wire load the configured rates ask for"""
+        # MAVLink 1 frame = 6 byte header + payload + 2 byte CRC
+        can = (mavlink.MAVLink_generic_can_frame_message.unpacker.size + 8) * sum(self.rates.values())
+        radio = (mavlink.MAVLink_radio_status_message.unpacker.size + 8) * self.radio_rate
+        heartbeat = (mavlink.MAVLink_heartbeat_message.unpacker.size + 8) * self.heartbeat_rate
+        return can + radio + heartbeat
+
+    def _error_gap(self) -> int:
+        """bits until the next flipped bit (geometric)"""
+        if self.ber <= 0:
+            return -1
+        u = self.rng.random()
+        return int(math.log(1.0 - u) / math.log(1.0 - self.ber)) if self.ber < 1 else 0
+
+    def _dropout_gap(self, t: float) -> float:
+        if self.dropouts <= 0:
+            return float("inf")
+        return t + self.rng.expovariate(self.dropouts)
+
+    def _encode(self, kind, t: float) -> bytes:
+        mav = self.mav
+        if kind == "radio":
+            rng = self.rng
+            msg = mav.radio_status_encode(rng.randint(90, 140), rng.randint(90, 140), rng.randint(40, 100),
+                                          rng.randint(20, 50), rng.randint(20, 50), 0, 0)
+        elif kind == "heartbeat":
+            msg = mav.heartbeat_encode(mavlink.MAV_TYPE_GENERIC, mavlink.MAV_AUTOPILOT_INVALID, 0, 0,
+                                       mavlink.MAV_STATE_ACTIVE)
+        else:
+            payload = self.payloads.payload(kind, t)
+            msg = mav.generic_can_frame_encode(int(t * 1000) & 0xFFFFFFFF, kind, payload)
+        frame = msg.pack(mav)
+        mav.seq = (mav.seq + 1) % 256
+        return frame
+
+    def _corrupt(self, t: float, frame: bytes) -> bytes:
+        """apply dropouts and bit errors to the bytes sent at t"""
+        if t >= self._next_dropout:
+            self._dropout_end = self._next_dropout + self.dropout_s
+            self._next_dropout = self._dropout_gap(self._dropout_end)
+        if t < self._dropout_end:
+            self.dropped_bytes += len(frame)
+            return b""
+        if self._next_error < 0:
+            return frame
+        bits = len(frame) * 8
+        if self._next_error >= bits:
+            self._next_error -= bits
+            return frame
+        out = bytearray(frame)
+        while self._next_error < bits:
+            out[self._next_error >> 3] ^= 1 << (self._next_error & 7)
+            self.bit_errors += 1
+            gap = self._error_gap()
+            self._next_error += gap + 1
+        self._next_error -= bits
+        return bytes(out)
+
+    def frames_until(self, duration: Optional[float] = None) -> Iterator[Tuple[float, bytes]]:
+        """(virtual time, bytes on the wire) in time order, endless without duration"""
+        queue: List[Tuple[float, int, object, float]] = []
+        sources = [(fid, hz) for fid, hz in sorted(self.rates.items())]
+        sources += [("radio", self.radio_rate), ("heartbeat", self.heartbeat_rate)]
+        for order, (kind, hz) in enumerate(sources):
+            if hz > 0:
+                # spread the first frames so IDs do not all start in the same instant
+                heapq.heappush(queue, (self.rng.uniform(0, 1.0 / hz), order, kind, 1.0 / hz))
+        while queue:
+            t, order, kind, period = heapq.heappop(queue)
+            if duration is not None and t >= duration:
+                return
+            heapq.heappush(queue, (t + period, order, kind, period))
+            frame = self._encode(kind, t)
+            self.frames += 1
+            self.bytes += len(frame)
+            yield t, self._corrupt(t, frame)
+
+    def chunks(self, duration: Optional[float] = None, tick: float = 0.005) -> Iterator[Tuple[float, bytes]]:
+        """frames grouped per tick, roughly what a UART driver hands over per read"""
+        buf = bytearray()
+        end = tick
+        for t, data in self.frames_until(duration):
+            if t >= end:
+                if buf:
+                    yield end, bytes(buf)
+                    buf.clear()
+                end = (math.floor(t / tick) + 1) * tick
+            buf += data
+        if buf:
+            yield end, bytes(buf)
+
+
+class VirtualClock(object):
+    """clock for write_paced() that jumps ahead on sleep() instead of waiting"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def write_paced(gen: TrafficGenerator, write: Callable[[bytes], None], baudrate: int, duration: Optional[float],
+                clock: Callable[[], float] = time.perf_counter, sleep: Callable[[float], None] = time.sleep) -> float:
+    """
+    write the stream in real time (or on a VirtualClock), never faster than
+    baudrate (8N1) allows, returns the seconds of backlog at the end
+    """
+    byte_time = 10.0 / baudrate
+    start = clock()
+    wire_free = 0.0  # virtual time the UART finishes what was written so far
+    backlog = 0.0
+    for t, chunk in gen.chunks(duration):
+        due = max(t, wire_free)
+        backlog = due - t
+        delay = due - (clock() - start)
+        if delay > 0:
+            sleep(delay)
+        if chunk:
+            write(chunk)
+            wire_free = due + len(chunk) * byte_time
+    return backlog
+
+
+def parse_rate(text: str) -> Tuple[int, float]:
+    frame_id, _, hz = text.partition("=")
+    return int(frame_id, 0), float(hz)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feed real MAVLink traffic built from a DBC to the bridge")
+    parser.add_argument("--dbc", required=True, help="Path to .dbc file")
+    parser.add_argument("--rate", action="append", type=parse_rate, default=[], metavar="ID=HZ",
+                        help="CAN frame rate, repeatable (e.g. 0x100=200)")
+    parser.add_argument("--default-rate", type=float, default=None,
+                        help="Hz for IDs without --rate, default: the DBC cycle time, else 10")
+    parser.add_argument("--only", action="store_true", help="Only send the IDs given with --rate")
+    parser.add_argument("--radio-rate", type=float, default=1.0, help="RADIO_STATUS Hz")
+    parser.add_argument("--heartbeat-rate", type=float, default=1.0, help="HEARTBEAT Hz")
+    parser.add_argument("--ber", type=float, default=0.0, help="Bit error rate")
+    parser.add_argument("--dropouts", type=float, default=0.0, help="Link dropouts per second")
+    parser.add_argument("--dropout-ms", type=float, default=200.0, help="Length of one dropout")
+    parser.add_argument("--baud", type=int, default=115200, help="UART rate the writing is paced to")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds of traffic, default endless")
+    out = parser.add_mutually_exclusive_group()
+    out.add_argument("--tcp", type=int, metavar="PORT", help="Serve on 127.0.0.1:PORT instead of a pty")
+    out.add_argument("--output", help="Write a capture file (.mmcap) as fast as possible instead")
+    args = parser.parse_args()
+
+    dbc = cantools.database.load_file(args.dbc)
+    rates = dict(args.rate)
+    if not args.only:
+        for m in dbc.messages:
+            if m.frame_id not in rates and m.length <= 8:
+                default = args.default_rate
+                if default is None:
+                    default = 1000.0 / m.cycle_time if m.cycle_time else 10.0
+                rates[m.frame_id] = default
+    gen = TrafficGenerator(dbc, rates, args.radio_rate, args.heartbeat_rate,
+                           args.ber, args.dropouts, args.dropout_ms, args.seed)
+
+    load = gen.frame_bytes_per_second()
+    capacity = args.baud / 10.0
+    print(f"[gen] {len(gen.rates)} CAN IDs, {sum(gen.rates.values()):.0f} frames/s, "
+          f"{load:.0f} B/s = {100.0 * load / capacity:.0f}% of {args.baud} baud")
+    if load > capacity:
+        print("[gen] requested load exceeds the UART, frames will back up")
+
+    if args.output:
+        from capture import CaptureWriter
+        directory = os.path.dirname(os.path.abspath(args.output))
+        # one file whatever the size, records on the clock of its header like a bridge capture
+        writer = CaptureWriter(directory, "gen", args.baud, max_bytes=0)
+        t0_ns = writer.start_ns
+        # paced like the live link but on a virtual clock, so the file never holds more than the UART carries
+        clock = VirtualClock()
+        backlog = write_paced(gen, lambda chunk: writer.write(t0_ns + int(clock.now * 1e9), chunk, block=True),
+                              args.baud, args.duration if args.duration is not None else 10.0, clock.time, clock.sleep)
+        writer.close()
+        os.replace(writer.files[0], args.output)
+        print(f"[gen] wrote {writer.bytes_written} bytes ({clock.now:.2f} s at {args.baud} baud) to {args.output}, "
+              f"{backlog:.2f} s backlog at the end")
+    else:
+        if args.tcp:
+            server = socket.create_server(("127.0.0.1", args.tcp))
+            print(f"[gen] waiting for the bridge on socket://127.0.0.1:{args.tcp}")
+            conn, _ = server.accept()
+
+            def write(data: bytes) -> None:
+                # discard what the bridge sends back (heartbeats, uplink) so its writes never block
+                while select.select([conn], [], [], 0)[0]:
+                    if not conn.recv(4096):
+                        break  # closed, the next sendall reports it
+                conn.sendall(data)
+        else:
+            import pty
+            import tty
+            master, slave = pty.openpty()
+            tty.setraw(master)
+            tty.setraw(slave)
+            print(f"[gen] serial port for the bridge: {os.ttyname(slave)}")
+
+            def write(data: bytes) -> None:
+                # discard what the bridge sends back (heartbeats) so the pty never fills up
+                while select.select([master], [], [], 0)[0]:
+                    os.read(master, 4096)
+                os.write(master, data)
+
+        try:
+            backlog = write_paced(gen, write, args.baud, args.duration)
+            print(f"[gen] done, {backlog:.2f} s backlog at the end")
+        except (KeyboardInterrupt, BrokenPipeError, ConnectionResetError):
+            pass
+    print(f"[gen] {gen.frames} frames, {gen.bytes} bytes, {gen.bit_errors} bit errors, "
+          f"{gen.dropped_bytes} bytes lost in dropouts")
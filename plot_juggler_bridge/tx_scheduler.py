@@ -0,0 +1,164 @@
+"""
+Radio aware uplink scheduler for the telemetry bridge.
+
+Everything the bridge sends towards the vehicle goes through TxScheduler
+instead of straight to ser.write, so an uplink burst can never fill the
+SiK radio buffer and stall the downlink telemetry:
+
+  - three priority queues, heartbeat above commands above bulk; heartbeats
+    coalesce (only the newest waits), the other queues refuse new messages
+    when full and count them as dropped
+  - a token bucket refilled at the uplink share of AIR_SPEED, capped by
+    what SERIAL_SPEED can carry, with a small burst allowance
+  - back-off from RADIO_STATUS.txbuf (free radio buffer in percent): below
+    txbuf_slow bulk is held and the rate halved, below txbuf_stop only
+    heartbeats go out; without a RADIO_STATUS for status_timeout seconds
+    the scheduler stays cautious at the "slow" level
+
+pump() is called periodically by the publisher, it packs every message it
+is allowed to send with the sender's reusable buffer and writes them in
+one call.
+
+Usage example:
+    tx = TxScheduler(sender, air_speed_kbps=64, serial_baud=115200)
+    tx.submit(msg, PRIO_COMMAND)
+    tx.update_radio_status(msg.txbuf)   # on every RADIO_STATUS
+    tx.pump()                           # every SEND_PERIOD
+"""
+
+import collections
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+import mavmc_dialect as mavlink
+
+PRIO_HEARTBEAT = 0
+PRIO_COMMAND = 1
+PRIO_BULK = 2
+PRIORITY_NAMES = ("heartbeat", "command", "bulk")
+
+# back-off levels
+TX_OK = 0
+TX_SLOW = 1
+TX_STOP = 2
+
+
+class TxScheduler(object):
+    def __init__(self, sender: mavlink.MAVLink, air_speed_kbps: float = 64.0, serial_baud: int = 57600,
+                 air_share: float = 0.5, burst_bytes: int = 300, txbuf_slow: int = 50, txbuf_stop: int = 20,
+                 status_timeout: float = 5.0, queue_len: int = 64) -> None:
+        self.sender = sender
+        # SiK alternates air time between both ends, the uplink gets air_share of it
+        self.rate = min(air_speed_kbps * 1000.0 / 8.0 * air_share, serial_baud / 10.0)
+        self.burst = float(burst_bytes)
+        self.txbuf_slow = txbuf_slow
+        self.txbuf_stop = txbuf_stop
+        self.status_timeout = status_timeout
+
+        self.lock = threading.Lock()
+        self.queues: List[Deque[mavlink.MAVLink_message]] = [collections.deque(maxlen=1),
+                                         collections.deque(), collections.deque()]
+        self.queue_len = queue_len
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.txbuf: Optional[int] = None
+        self.last_status = 0.0
+
+        self.sent = [0, 0, 0]
+        self.dropped = [0, 0, 0]
+        self.sent_bytes = 0
+        self.write_errors = 0
+
+    def submit(self, msg: mavlink.MAVLink_message, priority: int = PRIO_COMMAND) -> bool:
+        """queue a MAVLink message, False when its queue is full (counted as dropped)"""
+        with self.lock:
+            queue = self.queues[priority]
+            if priority == PRIO_HEARTBEAT:
+                if queue:
+                    self.dropped[priority] += 1  # superseded by the newer heartbeat
+                queue.append(msg)
+                return True
+            if len(queue) >= self.queue_len:
+                self.dropped[priority] += 1
+                return False
+            queue.append(msg)
+            return True
+
+    def update_radio_status(self, txbuf: int, now: Optional[float] = None) -> None:
+        """free radio buffer in percent from RADIO_STATUS.txbuf"""
+        self.txbuf = txbuf
+        self.last_status = time.monotonic() if now is None else now
+
+    def level(self, now: Optional[float] = None) -> int:
+        """current back-off level, TX_OK, TX_SLOW or TX_STOP"""
+        if now is None:
+            now = time.monotonic()
+        if self.txbuf is None or now - self.last_status > self.status_timeout:
+            return TX_SLOW
+        if self.txbuf < self.txbuf_stop:
+            return TX_STOP
+        if self.txbuf < self.txbuf_slow:
+            return TX_SLOW
+        return TX_OK
+
+    def pump(self, now: Optional[float] = None) -> int:
+        """send what the bucket and the radio allow, returns bytes written"""
+        if now is None:
+            now = time.monotonic()
+        level = self.level(now)
+        rate = self.rate if level == TX_OK else self.rate / 2
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.last_refill) * rate)
+        self.last_refill = now
+
+        batch = []
+        counts = [0, 0, 0]
+        with self.lock:
+            for priority, queue in enumerate(self.queues):
+                if level == TX_STOP and priority != PRIO_HEARTBEAT:
+                    break
+                if level == TX_SLOW and priority == PRIO_BULK:
+                    break
+                while queue:
+                    size = self.sender.encoded_size(queue[0])
+                    if size > self.tokens:
+                        break
+                    self.tokens -= size
+                    batch.append(queue.popleft())
+                    counts[priority] += 1
+                if queue:
+                    break  # keep the order, lower priorities wait behind a blocked queue
+        if not batch:
+            return 0
+        seq = self.sender.seq
+        try:
+            n = self.sender.send_many(batch)
+        except OSError as e:
+            # the batch is gone, retrying it on a failing port would only hold up newer messages;
+            # nothing went out, so the receiver must not see a sequence gap for it
+            self.sender.seq = seq
+            self.write_errors += 1
+            for priority, count in enumerate(counts):
+                self.dropped[priority] += count
+            print(f"[warn] Uplink write failed: {e}")
+            return 0
+        for priority, count in enumerate(counts):
+            self.sent[priority] += count
+        self.sent_bytes += n
+        return n
+
+    def signals(self, prefix: str = "bridge/tx/") -> Dict[str, Any]:
+        with self.lock:
+            depths = [len(q) for q in self.queues]
+        out = {
+            prefix + "level": self.level(),
+            prefix + "tokens": self.tokens,
+            prefix + "rate_bytes_s": self.rate,
+            prefix + "bytes": self.sent_bytes,
+            prefix + "write_errors": self.write_errors,
+        }
+        for i, name in enumerate(PRIORITY_NAMES):
+            out[f"{prefix}{name}/queued"] = depths[i]
+            out[f"{prefix}{name}/sent"] = self.sent[i]
+            out[f"{prefix}{name}/dropped"] = self.dropped[i]
+        return out
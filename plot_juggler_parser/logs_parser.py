@@ -2,6 +2,10 @@
 """
 TXT → Parquet log converter for Celka / PlotJuggler
 
+Raw UART captures of the telemetry bridge (.mmcap) are accepted as --input
+too, their frames are timed by the MCU timestamp aligned to host time with
+the same estimator the bridge runs live (clock_sync.py).
+
 Usage example:
 python plot_juggler_parser/logs_parser.py \
 --dbc D:/Dane/workspace/can-messages-mini-celka/can_messages_mini_celka.dbc \
@@ -16,12 +20,16 @@ import re
 import sys
 import argparse
 import datetime
-import struct
 from typing import Set
 import cantools
 import pandas as pd
 import numpy as np
 
+# compiled CAN extractors are shared with the telemetry bridge
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plot_juggler_bridge"))
+from can_decoder import CanDecodePlan, payload_column
+from clock_sync import align_offline, capture_ticks
+
 
 # ========== Helper functions ==========
 
@@ -49,6 +57,8 @@ class NKPL:
     def __init__(self):
         # Ignored IDs
         self.ignored_ids: Set[int] = set()
+        # Signals with a value table are stored as their names, like cantools decodes them
+        self.decode_choices = True
         self.init_and_clear_fields()
 
     # ------------------------------------
@@ -64,6 +74,11 @@ class NKPL:
     def set_ignored_ids(self, ids: Set[int] = set()) -> None:
         self.ignored_ids = set(ids)
 
+    # ------------------------------------
+    def set_decode_choices(self, enabled: bool = True) -> None:
+        """False stores the raw numbers of value table signals instead of their names."""
+        self.decode_choices = enabled
+
     # ------------------------------------
     def parse_and_decode(self, dbc_path: str, log_path: str, PRINT_ADDITIONAL_INFO=False):
         """Decode TXT log file using DBC definition."""
@@ -72,6 +87,9 @@ class NKPL:
         print(f"[decode] Input log: {log_path}")
 
         dbc = cantools.database.load_file(dbc_path)
+        plan = CanDecodePlan(dbc, sep="__")
+        # compiled frames are collected per ID and decoded column-wise at the end
+        columns = {}  # can_id -> (plan, timestamps, payloads)
         line_count = sum(1 for _ in open(log_path, 'r', encoding='utf-8', errors='ignore'))
         print(f"[decode] {line_count} lines detected ({human_readable_size(os.path.getsize(log_path))})")
 
@@ -136,43 +154,9 @@ class NKPL:
                     self.handle_corrupted_line(line, "Payload parse fail")
                     continue
 
-                # Skip ignored IDs
-                if can_id in self.ignored_ids:
-                    self.ignored_messages_counter += 1
-                    continue
-
-                # Decode CAN frame
-                try:
-                    message = dbc.get_message_by_frame_id(can_id)
-                    decoded = message.decode(payload)
-                except Exception as e:
-                    self.id_exception_counter += 1
-                    if PRINT_ADDITIONAL_INFO:
-                        print(f"[warn] ID 0x{can_id:X} decode fail: {e}")
-                    continue
-
-                # FLOAT32_IEEE conversion
-                for signal in message.signals:
-                    unit = signal.unit or ""
-                    if "FLOAT32_IEEE" in unit and signal.name in decoded:
-                        raw = decoded[signal.name]
-                        if isinstance(raw, int):
-                            try:
-                                decoded[signal.name] = struct.unpack('<f', raw.to_bytes(4, 'little'))[0]
-                            except Exception:
-                                pass
-
-                # Store decoded values
-                for key, val in decoded.items():
-                    name = f"{message.name}__{key}"
-                    if name not in self.database:
-                        self.database[name] = {'timestamps': [], 'values': []}
-                    self.database[name]['timestamps'].append(timestamp)
-                    self.database[name]['values'].append(val)
-
-                # Count this as one decoded CAN frame
-                self.decoded_messages_counter += 1
+                self.decode_frame(plan, columns, can_id, timestamp, payload, PRINT_ADDITIONAL_INFO)
 
+        self.decode_columns(columns)
 
         # Compute timespan directly from first and last valid log timestamps
         self.min_dt = getattr(self, "_first_timestamp", None)
@@ -186,6 +170,90 @@ class NKPL:
         if PRINT_ADDITIONAL_INFO:
             self.print_stats()
 
+    # ------------------------------------
+    def parse_capture(self, dbc_path: str, capture_path: str, tick_hz: float = 1000.0, PRINT_ADDITIONAL_INFO=False):
+        """Decode the GENERIC_CAN_FRAMEs of a bridge capture (.mmcap) on the aligned MCU time."""
+        self.init_and_clear_fields()
+        print(f"[decode] Using DBC: {dbc_path}")
+        print(f"[decode] Input capture: {capture_path}")
+
+        dbc = cantools.database.load_file(dbc_path)
+        plan = CanDecodePlan(dbc, sep="__")
+        ticks, hosts, msgs = capture_ticks(capture_path)
+        aligned, fits = align_offline(ticks, hosts, tick_hz)
+        print(f"[decode] {len(msgs)} CAN frames, {len(fits)} MCU uptime(s) "
+              f"({human_readable_size(os.path.getsize(capture_path))})")
+
+        columns = {}  # can_id -> (plan, timestamps, payloads)
+        for msg, t in zip(msgs, aligned):
+            self.line_counter += 1
+            timestamp = datetime.datetime.fromtimestamp(t)
+            if not hasattr(self, "_first_timestamp"):
+                self._first_timestamp = timestamp
+            # aligned times of one uptime only grow, keep the latest across resets
+            self._last_timestamp = max(timestamp, getattr(self, "_last_timestamp", timestamp))
+            self.decode_frame(plan, columns, msg.id, timestamp, bytes(msg.data), PRINT_ADDITIONAL_INFO)
+        self.decode_columns(columns)
+
+        self.min_dt = getattr(self, "_first_timestamp", None)
+        self.max_dt = getattr(self, "_last_timestamp", None)
+
+        print(f"[decode] Done. {self.line_counter} frames, {self.decoded_messages_counter} decoded.")
+
+        if PRINT_ADDITIONAL_INFO:
+            self.print_stats()
+
+    # ------------------------------------
+    def decode_frame(self, plan, columns: dict, can_id: int, timestamp, payload: bytes, PRINT_ADDITIONAL_INFO=False) -> None:
+        # Skip ignored IDs
+        if can_id in self.ignored_ids:
+            self.ignored_messages_counter += 1
+            return
+
+        # Decode CAN frame
+        frame = plan.lookup(can_id)
+        if frame is None or (frame.extractor is not None and len(payload) < frame.extractor.length):
+            self.id_exception_counter += 1
+            if PRINT_ADDITIONAL_INFO:
+                reason = "not in DBC" if frame is None else f"expected {frame.extractor.length} bytes"
+                print(f"[warn] ID 0x{can_id:X} decode fail: {reason}")
+            return
+
+        if frame.extractor is not None and not (self.decode_choices and frame.has_choices):
+            if can_id not in columns:
+                columns[can_id] = (frame, [], [])
+            columns[can_id][1].append(timestamp)
+            columns[can_id][2].append(payload)
+        else:
+            # multiplexed or long messages and value table names go through cantools one by one
+            decoded = {}
+            try:
+                frame.decode_cantools(payload, decoded, self.decode_choices)
+            except Exception as e:
+                self.id_exception_counter += 1
+                if PRINT_ADDITIONAL_INFO:
+                    print(f"[warn] ID 0x{can_id:X} decode fail: {e}")
+                return
+            for name, val in decoded.items():
+                self.store_value(name, [timestamp], [val])
+
+        # Count this as one decoded CAN frame
+        self.decoded_messages_counter += 1
+
+    # ------------------------------------
+    def decode_columns(self, columns: dict) -> None:
+        # Decode the collected payloads, one NumPy pass per frame ID and signal
+        for frame, timestamps, payloads in columns.values():
+            for name, values in frame.extractor.decode_columns(payload_column(payloads, frame.extractor.length)).items():
+                self.store_value(name, timestamps, values.tolist())
+
+    # ------------------------------------
+    def store_value(self, name: str, timestamps: list, values: list) -> None:
+        if name not in self.database:
+            self.database[name] = {'timestamps': [], 'values': []}
+        self.database[name]['timestamps'].extend(timestamps)
+        self.database[name]['values'].extend(values)
+
     # ------------------------------------
     def handle_corrupted_line(self, line: str, reason: str = None) -> None:
         self.corrupted_line_counter += 1
@@ -284,17 +352,23 @@ class NKPL:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Decode Celka TXT logs into Parquet for PlotJuggler")
     parser.add_argument("--dbc", required=True, help="Path to .dbc file")
-    parser.add_argument("--input", required=True, help="Path to .txt log file")
+    parser.add_argument("--input", required=True, help="Path to .txt log file or .mmcap bridge capture")
     parser.add_argument("--output", required=True, help="Path to output .parquet file")
     parser.add_argument("--ignore", nargs="*", default=[], help="IDs to ignore (hex, e.g. 0A 0B)")
     parser.add_argument("--verbose", action="store_true", help="Print extra corruption and decoding info")
+    parser.add_argument("--numeric", action="store_true", help="Store value table signals as numbers, not names")
+    parser.add_argument("--tick-hz", type=float, default=1000.0, help="MCU timestamp ticks per second (.mmcap input)")
     args = parser.parse_args()
 
     nkpl = NKPL()
     if args.ignore:
         nkpl.set_ignored_ids({int(x, 16) for x in args.ignore})
+    nkpl.set_decode_choices(not args.numeric)
 
-    nkpl.parse_and_decode(args.dbc, args.input, PRINT_ADDITIONAL_INFO=args.verbose)
+    if args.input.lower().endswith(".mmcap"):
+        nkpl.parse_capture(args.dbc, args.input, args.tick_hz, PRINT_ADDITIONAL_INFO=args.verbose)
+    else:
+        nkpl.parse_and_decode(args.dbc, args.input, PRINT_ADDITIONAL_INFO=args.verbose)
     df = nkpl.to_dataframe()
     nkpl.export_parquet(df, args.output, args.dbc, args.input)
     print(f"[done] Parsed '{args.input}' → '{args.output}' successfully.")